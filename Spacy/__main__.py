@@ -1,72 +1,129 @@
 import logging
+import argparse
 from appdirs import AppDirs
-from threading import Thread
-from spacy import load as get_pipe
 
 from gui import Root
-from utils import validate_dirs
+from assets import icons
+from timing import timers
+from config import ConfigManager
+from pipeline import load_pipeline, settings_components
+from utils import validate_dirs, pipeline_name, http_cache, timings_path
 from logs import setup_logs
-from constants import APP_NAME
+from constants import (
+    APP_NAME, BATCH_SIZE, OUTPUT_PATH, PIPELINES, SHARD_SIZE
+)
 
 
 log = logging.getLogger(__name__)
 
 def restart(root):
     root.destroy()
+    # Images can't outlive the interpreter they were created in
+    icons.clear()
     main()
 
-def load_spacy_pipeline(root:Root):
-    """Sets new attr as pipeline"""
-    log.info('Preparing to load nlp pipeline')
-    # Determine which pipeline to load
-    pipename = root.notebook.settings_tab.pipeline.get()
-    pipe_suffix = 'sm' if pipename == 'speed' else 'trf'
-    name = f'en_core_web_{pipe_suffix}'
-    # Disable GUI that requires pipeline to be loaded
-    root.addbar.update_gui_state(searching=True)
+def parse_args(argv:list[str]=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog=APP_NAME,
+        description='Runs the desktop app, or a headless batch job ' \
+                    'when --batch or --dump is given'
+    )
+    parser.add_argument(
+        '--batch', nargs='+', metavar='SOURCE',
+        help='urls, text files or directories of text files to parse'
+    )
+    parser.add_argument(
+        '--dump', metavar='PATH',
+        help='pages-articles xml.bz2 wikipedia dump to parse'
+    )
+    parser.add_argument(
+        '--shard-size', type=int, default=SHARD_SIZE,
+        help='number of articles written to each dump output shard'
+    )
+    parser.add_argument(
+        '--output', default=OUTPUT_PATH,
+        help='directory that batch results are written to'
+    )
+    parser.add_argument(
+        '--pipeline', choices=tuple(PIPELINES),
+        help='pipeline preference, defaults to the configured one'
+    )
+    parser.add_argument(
+        '--batch-size', type=int, default=BATCH_SIZE,
+        help='number of documents buffered per nlp.pipe batch'
+    )
+    parser.add_argument(
+        '--processes', type=int, default=1,
+        help='number of processes used by nlp.pipe, -1 for all cores'
+    )
+    return parser.parse_args(argv)
 
-    def load(retries=3):
-        if retries <= 0:
-            log.error(
-                'Exhausted retries for loading nlp pipeline'
-            )
-            root.addbar.update_gui_state(searching=False)
-            return
-        log.debug('Attempting to load spacy pipeline: ' + name)
-        try:
-            root.pipeline = get_pipe(name)
-        except OSError:
-            log.error(
-                'Failed to load nlp pipeline trying again in 3 seconds'
+def run_headless(args:argparse.Namespace, dirs:AppDirs):
+    """Parse a batch of sources without creating the GUI"""
+    from batch import run_batch
+    from chunking import chunk_plan
+    with timers.span('startup.config'):
+        settings = ConfigManager(dirs)['settings']
+    timers.configure(
+        settings.getboolean('record_timings'), timings_path(dirs)
+    )
+    pipename = args.pipeline or settings['pipeline']
+    name = pipeline_name(pipename)
+    log.info(f'Loading nlp pipeline {name} for headless batch')
+    with timers.span('startup.pipeline', pipeline=name):
+        pipeline = load_pipeline(name, **settings_components(settings))
+    if args.dump:
+        from dump import run_dump
+        with timers.span('batch.dump') as span:
+            count = run_dump(
+                pipeline=pipeline, dump_path=args.dump,
+                output_dir=args.output, batch_size=args.batch_size,
+                n_process=args.processes, shard_size=args.shard_size,
+                max_chars=chunk_plan(settings)[0]
             )
-            root.after(3000, lambda: load(retries-1))
-            return
-        log.info('Successfully loaded nlp pipeline')
-        root.addbar.update_gui_state(searching=False)
-    
-    # Load pipeline on a separate thread because it can
-    # take a while.
-    thread = Thread(target=load)
-    thread.daemon = True
-    thread.start()
+            span.set(articles=count)
+        log.info(f'Headless dump finished, {count} articles written')
+        return
+    with timers.span('batch.run') as span:
+        count = run_batch(
+            pipeline=pipeline,
+            sources=args.batch,
+            output_dir=args.output, batch_size=args.batch_size,
+            n_process=args.processes, cache=http_cache(dirs, settings),
+            max_chars=chunk_plan(settings)[0],
+            group_entities=settings.getboolean('group_entities')
+        )
+        span.set(documents=count)
+    log.info(f'Headless batch finished, parsed {count} documents')
 
-def main():
+def main(args:argparse.Namespace=None):
     log.info('Starting application')
+    # Start up is timed before the settings say whether to record it
+    timers.hold()
     # Validate app directories exist and setup logging
-    directories = AppDirs(APP_NAME)
-    validate_dirs(directories)
-    setup_logs(directories)
+    with timers.span('startup.app_dirs'):
+        directories = AppDirs(APP_NAME)
+        validate_dirs(directories)
+    with timers.span('startup.logs'):
+        setup_logs(directories)
+    if args is not None and (args.batch or args.dump):
+        run_headless(args, directories)
+        return
     # Create and start GUI
-    root = Root(
-        name=APP_NAME,
-        dirs=directories,
-        restart_func=restart
-    )
-    load_spacy_pipeline(root)
+    with timers.span('startup.window'):
+        root = Root(
+            name=APP_NAME,
+            dirs=directories,
+            restart_func=restart
+        )
+        # Paint the window before the pipeline (and spacy) starts
+        # loading
+        root.update_idletasks()
+    root.load_pipeline()
     root.start()
     # This line will only be read if the GUI has been closed properly
     log.info('Exited application successfully')
 
 if __name__ == '__main__':
-    main()
+    main(parse_args())
     
@@ -0,0 +1,166 @@
+import os
+import json
+import logging
+import tkinter as tk
+from pathlib import Path
+from collections import OrderedDict
+
+from constants import ASSETS_PATH, ICON_CACHE_SIZE
+from exceptions import ImageNotFound
+
+
+log = logging.getLogger(__name__)
+
+SHEET_FILE = 'icons.png'
+INDEX_FILE = 'icons.json'
+
+
+def _key(filename:str, size:tuple[int, int]) -> str:
+    return f'{filename}|{size[0]}x{size[1]}'
+
+def _mtime(filename:str) -> int | None:
+    try:
+        return os.stat(os.path.join(ASSETS_PATH, filename)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def _replace(path:Path, write):
+    """Write a file through a temp file so readers never see half of it"""
+    temp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    try:
+        write(temp)
+        os.replace(temp, path)
+    finally:
+        if temp.exists():
+            temp.unlink()
+
+
+class IconCache:
+    """
+        Process level cache of resized icons. Each icon is resized once
+        per (file, size) and packed into a sprite sheet in the cache
+        directory, keyed by the modified time of its source, so later
+        starts decode a single PNG with Tk and crop every icon out of
+        it without loading PIL. PhotoImages are kept in an LRU while
+        their Tk interpreter is alive.
+    """
+    def __init__(self, max_images:int=ICON_CACHE_SIZE):
+        self.max_images = max_images
+        self._dir = None
+        # Key to [source mtime, x, y, width, height] in the sheet
+        self._index = {}
+        self._sheet = None
+        self._images = OrderedDict()
+        # Icons resized since the sheet was last written
+        self._pending = {}
+
+    def set_directory(self, directory:str):
+        """Keep the sprite sheet in directory"""
+        self._dir = Path(directory)
+        self._dir.mkdir(parents=True, exist_ok=True)
+        try:
+            with open(self._dir / INDEX_FILE, 'r') as file:
+                self._index = json.load(file)
+        except (OSError, ValueError):
+            self._index = {}
+        self._sheet = None
+
+    def clear(self):
+        """Drop the images of a Tk interpreter that is being destroyed"""
+        self._images.clear()
+        self._sheet = None
+
+    def get(self, filename:str, size:tuple[int, int]) -> tk.PhotoImage:
+        """Returns the icon in filename resized to size"""
+        key = _key(filename, size)
+        image = self._images.get(key)
+        if image is not None:
+            self._images.move_to_end(key)
+            return image
+        mtime = _mtime(filename)
+        if mtime is None:
+            fp = os.path.join(ASSETS_PATH, filename)
+            log.error(f'could not find image at fp: {fp}')
+            raise ImageNotFound(fp)
+        image = self._from_sheet(key, mtime)
+        if image is None:
+            image = self._resize(key, filename, size, mtime)
+        self._images[key] = image
+        if len(self._images) > self.max_images:
+            self._images.popitem(last=False)
+        return image
+
+    def _from_sheet(self, key:str, mtime:int) -> tk.PhotoImage | None:
+        entry = self._index.get(key)
+        if entry is None or entry[0] != mtime or key in self._pending:
+            return None
+        if self._sheet is None:
+            try:
+                self._sheet = tk.PhotoImage(
+                    file=str(self._dir / SHEET_FILE)
+                )
+            except tk.TclError:
+                log.warning('Could not read the icon sheet, rebuilding it')
+                self._index = {}
+                return None
+        _, x, y, width, height = entry
+        image = tk.PhotoImage(width=width, height=height)
+        image.tk.call(
+            image, 'copy', self._sheet,
+            '-from', x, y, x + width, y + height
+        )
+        return image
+
+    def _resize(
+            self, key:str, filename:str, size:tuple[int, int], mtime:int
+        ) -> tk.PhotoImage:
+        from PIL import Image, ImageTk
+        log.debug(f'Resizing icon {filename} to {size}')
+        with Image.open(os.path.join(ASSETS_PATH, filename)) as im:
+            im = im.convert('RGBA').resize(size, Image.LANCZOS)
+        self._pending[key] = (mtime, im)
+        return ImageTk.PhotoImage(im)
+
+    def save(self):
+        """Add the icons resized since the last save to the sheet"""
+        if self._dir is None or not self._pending:
+            return
+        from PIL import Image
+        icons = {}
+        sheet_path = self._dir / SHEET_FILE
+        if self._index and sheet_path.exists():
+            # Keep the icons whose source hasn't changed
+            with Image.open(sheet_path) as sheet:
+                for key, (mtime, x, y, width, height) in \
+                        self._index.items():
+                    if key in self._pending \
+                            or _mtime(key.split('|')[0]) != mtime:
+                        continue
+                    icons[key] = (
+                        mtime, sheet.crop((x, y, x + width, y + height))
+                    )
+        icons.update(self._pending)
+        # Icons are laid out in a single row
+        sheet = Image.new('RGBA', (
+            sum(im.width for _, im in icons.values()),
+            max(im.height for _, im in icons.values())
+        ))
+        index, x = {}, 0
+        for key, (mtime, im) in icons.items():
+            sheet.paste(im, (x, 0))
+            index[key] = [mtime, x, 0, im.width, im.height]
+            x += im.width
+        _replace(sheet_path, lambda path: sheet.save(path, format='PNG'))
+
+        def write_index(path:Path):
+            with open(path, 'w') as file:
+                json.dump(index, file)
+
+        _replace(self._dir / INDEX_FILE, write_index)
+        log.info(f'Wrote {len(index)} icons to the icon sheet')
+        self._index = index
+        self._pending = {}
+        self._sheet = None
+
+
+icons = IconCache()
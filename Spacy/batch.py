@@ -0,0 +1,128 @@
+import csv
+import re
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from pathlib import Path
+from typing import Iterable, Iterator
+from urllib.parse import urlparse
+from requests.exceptions import RequestException
+from spacy.language import Language
+
+from utils import (
+    web_scrape, read_text_file, parse_document, open_new_file, chunked
+)
+from cache import HTTPCache
+from results import TokenTable, EntityGroups
+from constants import BATCH_SIZE
+
+
+log = logging.getLogger(__name__)
+
+
+def collect_sources(sources:Iterable[str]) -> list[str]:
+    """Expands directories into the text files they contain"""
+    collected = []
+    for source in sources:
+        if urlparse(source).netloc:
+            collected.append(source)
+            continue
+        path = Path(source)
+        if path.is_dir():
+            collected.extend(str(fp) for fp in sorted(path.glob('*.txt')))
+            continue
+        collected.append(source)
+    return collected
+
+def load_source(source:str, cache:HTTPCache=None) -> tuple[str, str]:
+    """Returns the title and text of a url or text file"""
+    if urlparse(source).netloc:
+        title, content = web_scrape(
+            source, remove_linebreak=True, cache=cache
+        )
+    else:
+        title, content = read_text_file(source)
+    return title, "".join(content)
+
+def _resolve(source:str, future:Future) -> tuple | None:
+    try:
+        title, text = future.result()
+    except (RequestException, OSError) as e:
+        log.error(f'Skipping {source}, failed to load content: {e}')
+        return None
+    return text, (source, title)
+
+def _prefetch(
+        sources:list[str], workers:int, cache:HTTPCache=None
+    ) -> Iterator[tuple]:
+    """
+        Yields (text, (source, title)) tuples in source order while
+        the next few sources are fetched in the background.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for source in sources:
+            pending.append((source, executor.submit(load_source, source, cache)))
+            # Keep a bounded window of fetches in flight
+            if len(pending) < workers * 2:
+                continue
+            item = _resolve(*pending.popleft())
+            if item: yield item
+        while pending:
+            item = _resolve(*pending.popleft())
+            if item: yield item
+
+def _safe_filename(title:str) -> str:
+    name = re.sub(r'[^\w\- ]', '', title or '').strip()
+    return name.replace(' ', '_') or 'document'
+
+def run_batch(
+        pipeline:Language, sources:Iterable[str], output_dir:str,
+        batch_size:int=BATCH_SIZE, n_process:int=1, fetch_workers:int=4,
+        cache:HTTPCache=None, max_chars:int=None,
+        group_entities:bool=False
+    ) -> int:
+    """
+        Parse every source with nlp.pipe and write one csv file of
+        [word, entity, pos] rows per document, or of [entity, entity,
+        count, first offset] rows when grouping entities. A
+        manifest.csv is written alongside them. Returns the number of
+        documents.
+    """
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    sources = collect_sources(sources)
+    log.info(
+        f'Starting batch of {len(sources)} sources, '
+        f'batch_size={batch_size} n_process={n_process}'
+    )
+    max_chars = min(max_chars or pipeline.max_length, pipeline.max_length)
+    docs = pipeline.pipe(
+        chunked(_prefetch(sources, fetch_workers, cache), max_chars),
+        as_tuples=True, batch_size=batch_size, n_process=n_process
+    )
+    count = 0
+    tables = []
+    with open(
+        f'{output_dir}/manifest.csv', 'w', newline='', encoding='utf-8'
+    ) as manifest_file:
+        manifest = csv.writer(manifest_file)
+        manifest.writerow(('source', 'title', 'tokens', 'output'))
+        for doc, (source, title, last) in docs:
+            tables.append(parse_document(doc))
+            if not last:
+                continue
+            parsed = TokenTable.concat(tables)
+            if group_entities:
+                parsed = EntityGroups.from_table(parsed)
+            tables = []
+            file = open_new_file(
+                output_dir, prefix=_safe_filename(title), ext='csv',
+                newline=''
+            )
+            with file:
+                csv.writer(file).writerows(parsed)
+            manifest.writerow((source, title, len(parsed), file.name))
+            count += 1
+            log.debug(f'Wrote {len(parsed)} rows for {source}')
+    log.info(f'Finished batch, wrote {count} documents to {output_dir}')
+    return count
@@ -0,0 +1,58 @@
+"""
+    Compares the streaming content extractor used by web_scrape with
+    the previous full BeautifulSoup parse on saved html pages.
+
+    Run from the Spacy directory:
+        python -m benchmarks.html_extraction pages_dir [--repeat N]
+"""
+import time
+import argparse
+from pathlib import Path
+
+from extract import extract_content, extract_content_soup
+
+
+def _time(func, html:bytes, repeat:int) -> tuple[float, tuple]:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(html)
+    return (time.perf_counter() - start) / repeat, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('pages_dir', help='directory of saved .html pages')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    pages = sorted(Path(args.pages_dir).glob('*.htm*'))
+    if not pages:
+        parser.error(f'no .html files found in {args.pages_dir}')
+    print(
+        f"{'page':<40}{'soup ms':>10}{'stream ms':>11}{'speedup':>9}"
+        f"{'paragraphs':>12}  match"
+    )
+    totals = [0, 0]
+    for page in pages:
+        html = page.read_bytes()
+        soup_time, expected = _time(extract_content_soup, html, args.repeat)
+        fast_time, result = _time(extract_content, html, args.repeat)
+        totals[0] += soup_time
+        totals[1] += fast_time
+        # Paragraphs outside the content container are skipped on
+        # purpose, so compare against the soup paragraphs in order.
+        soup_paragraphs = iter(expected[1])
+        match = result[0] == expected[0] and all(
+            paragraph in soup_paragraphs for paragraph in result[1]
+        )
+        print(
+            f'{page.name[:39]:<40}{soup_time * 1000:>10.1f}'
+            f'{fast_time * 1000:>11.1f}{soup_time / fast_time:>8.1f}x'
+            f'{len(result[1]):>6}/{len(expected[1]):<5}  '
+            f"{'yes' if match else 'NO'}"
+        )
+    print(
+        f"{'total':<40}{totals[0] * 1000:>10.1f}{totals[1] * 1000:>11.1f}"
+        f'{totals[0] / totals[1]:>8.1f}x'
+    )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+    Compares throughput and memory of the full en_core_web pipelines
+    against the reduced pipelines loaded for the enabled columns.
+
+    Run from the Spacy directory:
+        python -m benchmarks.pipeline_components [text_file] [--docs N]
+"""
+import sys
+import time
+import argparse
+from multiprocessing import get_context
+
+from pipeline import load_pipeline, excluded_components
+from constants import PIPELINES
+
+
+SAMPLE = (
+    'Python is a high-level, general-purpose programming language. '
+    'Guido van Rossum began working on Python in the late 1980s as a '
+    'successor to the ABC programming language and first released it '
+    'in 1991 as Python 0.9.0. Python 2.0 was released in 2000 and '
+    'Python 3.0, released in 2008, was a major revision. '
+)
+
+# Name of each configuration and the columns it enables
+CONFIGS = {
+    'full': None,
+    'entities + pos': (True, True),
+    'entities only': (True, False),
+    'pos only': (False, True),
+}
+
+
+def _peak_memory_mb() -> float | None:
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / 1024 ** 2
+    except ImportError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+def _run(name:str, columns:tuple | None, texts:list[str]) -> dict:
+    """Runs in a fresh process so memory readings are independent"""
+    exclude = [] if columns is None else excluded_components(*columns)
+    start = time.perf_counter()
+    pipeline = load_pipeline(name, exclude=exclude)
+    load_time = time.perf_counter() - start
+    start = time.perf_counter()
+    tokens = sum(len(doc) for doc in pipeline.pipe(texts))
+    parse_time = time.perf_counter() - start
+    return {
+        'components': ','.join(pipeline.pipe_names),
+        'load_s': load_time,
+        'tokens_per_s': tokens / parse_time,
+        'peak_mb': _peak_memory_mb()
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('text_file', nargs='?')
+    parser.add_argument('--docs', type=int, default=200)
+    args = parser.parse_args()
+    text = SAMPLE * 10
+    if args.text_file:
+        with open(args.text_file, 'r', encoding='utf-8') as file:
+            text = file.read()
+    texts = [text] * args.docs
+    context = get_context('spawn')
+    print(
+        f"{'pipeline':<18}{'config':<16}{'load s':>8}"
+        f"{'tokens/s':>12}{'peak MB':>10}  components"
+    )
+    for name in PIPELINES.values():
+        baseline = None
+        for config, columns in CONFIGS.items():
+            with context.Pool(1) as pool:
+                try:
+                    result = pool.apply(_run, (name, columns, texts))
+                except OSError as e:
+                    print(f'{name:<18}not installed: {e}')
+                    break
+            baseline = baseline or result['tokens_per_s']
+            speedup = result['tokens_per_s'] / baseline
+            peak = result['peak_mb']
+            peak = f'{peak:>10.0f}' if peak is not None else f"{'n/a':>10}"
+            print(
+                f"{name:<18}{config:<16}{result['load_s']:>8.2f}"
+                f"{result['tokens_per_s']:>12.0f}{peak}  "
+                f"{result['components']} (x{speedup:.2f})"
+            )
+
+if __name__ == '__main__':
+    main()
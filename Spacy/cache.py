@@ -0,0 +1,215 @@
+from __future__ import annotations
+import os
+import json
+import time
+import logging
+import hashlib
+from pathlib import Path
+from threading import Lock, get_ident
+from typing import TYPE_CHECKING
+
+from constants import HTTP_TIMEOUT_S
+
+if TYPE_CHECKING:
+    import requests
+    from spacy.language import Language
+    from spacy.tokens import Doc, DocBin
+
+
+log = logging.getLogger(__name__)
+
+
+class DiskCache:
+    """
+        Directory of cached files that is kept under a size limit by
+        evicting the least recently used entries first.
+    """
+    def __init__(self, directory:str, max_bytes:int):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = Lock()
+
+    def _key(self, *parts:str) -> str:
+        return hashlib.sha256('\0'.join(parts).encode()).hexdigest()
+
+    def _path(self, key:str, ext:str) -> Path:
+        return self.dir / f'{key}.{ext}'
+
+    def _write(self, path:Path, data:bytes):
+        """Atomically write bytes so readers never see partial files"""
+        # Unique per writer as worker processes share the directory
+        temp = path.parent / f'{path.name}.{os.getpid()}.{get_ident()}.tmp'
+        temp.write_bytes(data)
+        os.replace(temp, path)
+
+    def _touch(self, path:Path):
+        """Mark an entry as recently used"""
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def _entries(self) -> dict[str, list[Path]]:
+        entries = {}
+        for path in self.dir.iterdir():
+            if path.suffix == '.tmp':
+                continue
+            entries.setdefault(path.stem, []).append(path)
+        return entries
+
+    def remove(self, key:str):
+        for path in self.dir.glob(f'{key}.*'):
+            path.unlink(missing_ok=True)
+
+    def evict(self):
+        """Remove least recently used entries until under max_bytes"""
+        with self._lock:
+            entries = []
+            total = 0
+            for key, paths in self._entries().items():
+                stats = [path.stat() for path in paths]
+                size = sum(stat.st_size for stat in stats)
+                used = max(stat.st_mtime for stat in stats)
+                entries.append((used, size, key))
+                total += size
+            if total <= self.max_bytes:
+                return
+            entries.sort()
+            for used, size, key in entries:
+                if total <= self.max_bytes:
+                    break
+                log.debug(f'Evicting cache entry {key} from {self.dir}')
+                self.remove(key)
+                total -= size
+
+    def clear(self):
+        with self._lock:
+            for key in self._entries():
+                self.remove(key)
+
+
+class HTTPCache(DiskCache):
+    """
+        Persistent cache of http responses. Responses younger than the
+        ttl are served from disk, older ones are revalidated with a
+        conditional request using their ETag and Last-Modified headers.
+    """
+    def __init__(self, directory:str, ttl:float, max_bytes:int):
+        super().__init__(directory, max_bytes)
+        self.ttl = ttl
+
+    def _read_meta(self, key:str) -> dict | None:
+        try:
+            meta = json.loads(self._path(key, 'json').read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if not self._path(key, 'body').exists():
+            return None
+        return meta
+
+    def _read_body(self, key:str) -> bytes:
+        path = self._path(key, 'body')
+        self._touch(path)
+        return path.read_bytes()
+
+    def _store(self, key:str, url:str, response:requests.Response):
+        meta = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched': time.time()
+        }
+        with self._lock:
+            self._write(self._path(key, 'body'), response.content)
+            self._write(self._path(key, 'json'), json.dumps(meta).encode())
+
+    def _refresh(self, key:str, meta:dict):
+        meta['fetched'] = time.time()
+        with self._lock:
+            self._write(self._path(key, 'json'), json.dumps(meta).encode())
+
+    def get(self, url:str) -> bytes:
+        """Returns the body of the response for this url"""
+        import requests
+        key = self._key(url)
+        meta = self._read_meta(key)
+        if meta and time.time() - meta['fetched'] < self.ttl:
+            log.debug(f'Serving {url} from http cache')
+            return self._read_body(key)
+        headers = {}
+        if meta and meta['etag']:
+            headers['If-None-Match'] = meta['etag']
+        if meta and meta['last_modified']:
+            headers['If-Modified-Since'] = meta['last_modified']
+        try:
+            response = requests.get(
+                url, headers=headers, timeout=HTTP_TIMEOUT_S
+            )
+        except (requests.ConnectionError, requests.Timeout):
+            if not meta:
+                raise
+            log.warning(f'Offline, serving stale cached response for {url}')
+            return self._read_body(key)
+        if response.status_code == 304 and meta:
+            log.debug(f'Revalidated cached response for {url}')
+            self._refresh(key, meta)
+            return self._read_body(key)
+        if response.status_code == 200:
+            self._store(key, url, response)
+            self.evict()
+        return response.content
+
+
+class ParseCache(DiskCache):
+    """
+        Content addressed cache of parsed documents. Entries are keyed
+        by the hash of the parsed text together with the pipeline that
+        parsed it and are stored as a spacy DocBin.
+    """
+    # Only the attributes the app reads are serialized
+    attrs = ('ORTH', 'SPACY', 'POS', 'ENT_IOB', 'ENT_TYPE')
+
+    def _pipeline_key(self, pipeline:Language, text:str, variant:str) -> str:
+        meta = pipeline.meta
+        return self._key(
+            hashlib.sha256(text.encode()).hexdigest(),
+            f"{meta.get('lang')}_{meta.get('name')}",
+            str(meta.get('version')),
+            ','.join(pipeline.pipe_names),
+            variant
+        )
+
+    def docbin(self) -> DocBin:
+        """Returns an empty DocBin for collecting docs to cache"""
+        from spacy.tokens import DocBin
+        return DocBin(attrs=self.attrs, store_user_data=False)
+
+    def get(
+            self, pipeline:Language, text:str, variant:str='whole'
+        ) -> list[Doc] | None:
+        """Returns the cached docs for this text, or None"""
+        from spacy.tokens import DocBin
+        path = self._path(
+            self._pipeline_key(pipeline, text, variant), 'spacy'
+        )
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        self._touch(path)
+        log.debug(f'Serving parsed content from parse cache {path.name}')
+        docbin = DocBin().from_bytes(data)
+        return list(docbin.get_docs(pipeline.vocab))
+
+    def put(
+            self, pipeline:Language, text:str, docbin:DocBin,
+            variant:str='whole'
+        ):
+        """Store the docs that were parsed from this text"""
+        path = self._path(
+            self._pipeline_key(pipeline, text, variant), 'spacy'
+        )
+        with self._lock:
+            self._write(path, docbin.to_bytes())
+        self.evict()
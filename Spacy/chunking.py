@@ -0,0 +1,70 @@
+import re
+import logging
+from typing import Iterator
+
+from constants import CHUNK_BYTES_PER_CHAR
+
+
+log = logging.getLogger(__name__)
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _split(text:str, pattern:re.Pattern) -> list[str]:
+    """Split text after each match, keeping every character"""
+    pieces = []
+    start = 0
+    for match in pattern.finditer(text):
+        pieces.append(text[start:match.end()])
+        start = match.end()
+    pieces.append(text[start:])
+    return [piece for piece in pieces if piece]
+
+def _pieces(text:str, max_chars:int) -> Iterator[str]:
+    """
+        Yields pieces no longer than max_chars, breaking on paragraphs
+        first, then sentences, then whitespace and only then mid word.
+    """
+    for paragraph in text.splitlines(keepends=True):
+        if len(paragraph) <= max_chars:
+            yield paragraph
+            continue
+        for sentence in _split(paragraph, _SENTENCE_END):
+            if len(sentence) <= max_chars:
+                yield sentence
+                continue
+            for word in _split(sentence, _WHITESPACE):
+                for i in range(0, len(word), max_chars):
+                    yield word[i:i + max_chars]
+
+def chunk_text(text:str, max_chars:int) -> Iterator[str]:
+    """
+        Yields chunks of at most max_chars that join back into text.
+        Pieces are packed together so chunks are as large as allowed.
+    """
+    chunk = []
+    size = 0
+    for piece in _pieces(text, max_chars):
+        if size + len(piece) > max_chars and chunk:
+            yield ''.join(chunk)
+            chunk, size = [], 0
+        chunk.append(piece)
+        size += len(piece)
+    # Always yield at least one chunk so empty text still parses
+    yield ''.join(chunk)
+
+def chunk_plan(settings) -> tuple[int, int]:
+    """
+        Returns (max_chars, batch_size) so that the text in flight,
+        max_chars * batch_size, fits the configured memory budget.
+    """
+    budget = settings.getint('memory_budget_mb') * 1024 ** 2
+    per_char = CHUNK_BYTES_PER_CHAR.get(
+        settings['pipeline'], max(CHUNK_BYTES_PER_CHAR.values())
+    )
+    chars_in_flight = max(1, budget // per_char)
+    max_chars = max(1, min(settings.getint('chunk_chars'), chars_in_flight))
+    batch_size = max(1, chars_in_flight // max_chars)
+    log.debug(f'Chunk plan: max_chars={max_chars} batch_size={batch_size}')
+    return max_chars, batch_size
@@ -3,7 +3,7 @@ from configparser import ConfigParser
 from appdirs import AppDirs
 from os.path import exists
 from distutils.util import strtobool
-from tkinter import StringVar, BooleanVar
+from tkinter import StringVar, BooleanVar, IntVar
 
 from constants import OUTPUT_PATH
 
@@ -16,10 +16,28 @@ defaults = {
     'settings': {
         'auto_save': 'no',
         'auto_save_path': str(OUTPUT_PATH),
+        'export_format': 'csv',
         'default_url': 'https://en.wikipedia.org/wiki/',
         'group_entities': 'no',
+        'stream_results': 'yes',
+        'keep_history': 'yes',
+        'record_timings': 'no',
         'colour_mode': 'light',
-        'pipeline': 'speed'
+        'pipeline': 'speed',
+        'entity_column': 'yes',
+        'pos_column': 'yes',
+        'keep_components': '',
+        'disable_components': '',
+        'nlp_workers': '0',
+        'job_timeout_s': '120',
+        'crawl_depth': '1',
+        'crawl_pages': '25',
+        'crawl_connections': '4',
+        'memory_budget_mb': '512',
+        'chunk_chars': '20000',
+        'cache_ttl_hours': '24',
+        'cache_size_mb': '200',
+        'parse_cache_size_mb': '500'
     },
     'entities': {
         'PERSON': 'People, including fictional characters.',
@@ -83,6 +101,7 @@ class ConfigManager(ConfigParser):
         """Validate the contents and existance of the config"""
         log.info('Validating config')
         if exists(self.fp) and not force_restore:
+            self._add_missing_options()
             return
         log.info('Restoring configs')
         for section, options in defaults.items():
@@ -90,15 +109,37 @@ class ConfigManager(ConfigParser):
         with open(self.fp, 'w') as file: 
             self.write(file)
 
+    def _add_missing_options(self):
+        """Add options that were introduced after the config was made"""
+        self.read(self.fp)
+        missing = False
+        for section, options in defaults.items():
+            if not self.has_section(section):
+                self.add_section(section)
+            for option, value in options.items():
+                if self.has_option(section, option):
+                    continue
+                log.info(f'Adding missing config option <{option}>')
+                self.set(section, option, value)
+                missing = True
+        if not missing:
+            return
+        with open(self.fp, 'w') as file:
+            self.write(file)
+
     def create_settings_vars(self) -> list:
         """returns list of tk vars created from the configuration"""
         variables = []
         for key, value in self['settings'].items():
             try:
-                value = strtobool(value)
-                var = BooleanVar
+                value = int(value)
+                var = IntVar
             except ValueError:
-                var = StringVar
+                try:
+                    value = strtobool(value)
+                    var = BooleanVar
+                except ValueError:
+                    var = StringVar
             var = var(name=key)
             var.set(value)
             variables.append((key, var))
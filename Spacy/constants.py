@@ -14,3 +14,49 @@ APP_NAME = 'Spacy-Research-Project'
 FILENAME_PREFIX_FORMAT = '%Y-%m-%d %H-%M-%S'
 MAX_LOGFILE_AGE_DAYS = 7
 WIKI = 'https://en.wikipedia.org/wiki/'
+# Seconds a request may take to connect, or wait between bytes
+HTTP_TIMEOUT_S = 20
+# Milliseconds between drains of the callbacks posted to the Tk thread
+DISPATCH_INTERVAL_MS = 20
+COLOUR_MODES = ('light', 'dark')
+# Resized icons kept in memory
+ICON_CACHE_SIZE = 64
+# Stage timings kept for the timings panel
+MAX_TIMINGS = 500
+# Background colours of entity types in the content tab
+ENTITY_COLOURS = {
+    'light': (
+        '#FFE0B2', '#C8E6C9', '#BBDEFB', '#F8BBD0', '#D1C4E9',
+        '#B2EBF2', '#FFF9C4', '#D7CCC8', '#F0F4C3', '#FFCCBC'
+    ),
+    'dark': (
+        '#6D4C1F', '#2E5E33', '#22496E', '#6E2846', '#463A6B',
+        '#1F5A61', '#66602A', '#4E3F38', '#4F5A22', '#6E3A28'
+    )
+}
+
+# NLP
+PIPELINES = {
+    'speed': 'en_core_web_sm',
+    'accuracy': 'en_core_web_trf'
+}
+BATCH_SIZE = 64
+# Articles written to each output file of a wikipedia dump run
+SHARD_SIZE = 10000
+# Rough peak working memory per character of text being parsed, used to
+# size chunks and batches to fit the memory budget.
+CHUNK_BYTES_PER_CHAR = {
+    'speed': 600,
+    'accuracy': 6000
+}
+# Components the en_core_web pipelines can run without. The tok2vec and
+# transformer components are always kept because the others listen to
+# them.
+OPTIONAL_COMPONENTS = (
+    'tagger', 'attribute_ruler', 'lemmatizer', 'parser', 'senter', 'ner'
+)
+# Components whose output is read by each results column
+COLUMN_COMPONENTS = {
+    'entities': ('ner',),
+    'pos': ('tagger', 'attribute_ruler')
+}
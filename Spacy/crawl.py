@@ -0,0 +1,118 @@
+import logging
+from collections import deque
+from threading import Lock, BoundedSemaphore
+from concurrent.futures import ThreadPoolExecutor, Future, wait, \
+    FIRST_COMPLETED
+from typing import Iterable, Iterator
+from urllib.parse import urljoin, urlparse, urldefrag, unquote
+
+from utils import fetch_html
+from extract import extract_page
+from cache import HTTPCache
+
+
+log = logging.getLogger(__name__)
+
+ARTICLE_PATH = '/wiki/'
+
+
+def article_links(base:str, hrefs:Iterable[str]) -> list[str]:
+    """
+        Returns the absolute urls of the links that point at other
+        articles on the same wiki, in page order and without repeats.
+        Links to special, talk, file and other namespaced pages are
+        skipped.
+    """
+    host = urlparse(base).netloc
+    links = {}
+    for href in hrefs:
+        url, _ = urldefrag(urljoin(base, href))
+        parsed = urlparse(url)
+        if parsed.netloc != host or parsed.query:
+            continue
+        if not parsed.path.startswith(ARTICLE_PATH):
+            continue
+        name = unquote(parsed.path[len(ARTICLE_PATH):])
+        if not name or ':' in name:
+            continue
+        links[url] = None
+    return list(links)
+
+
+class Crawler:
+    """
+        Breadth first crawl of the articles linked from a seed url.
+        Pages are fetched on a thread pool with a limit on concurrent
+        requests to each host, and are yielded as soon as they arrive
+        so parsing can run while the next pages are being fetched.
+    """
+    def __init__(
+            self, seed:str, depth:int, max_pages:int, cache:HTTPCache=None,
+            workers:int=8, per_host:int=4
+        ):
+        self.seed = urldefrag(seed)[0]
+        self.depth = depth
+        self.max_pages = max_pages
+        self.cache = cache
+        self.workers = workers
+        self.per_host = per_host
+        self._hosts = {}
+        self._lock = Lock()
+
+    def _host_limit(self, url:str) -> BoundedSemaphore:
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = BoundedSemaphore(self.per_host)
+            return self._hosts[host]
+
+    def _fetch(self, url:str) -> tuple[str, list[str], list[str]]:
+        with self._host_limit(url):
+            html = fetch_html(url, self.cache)
+        title, content, hrefs = extract_page(html)
+        content = [item.replace('\n', '') for item in content]
+        return title, content, article_links(url, hrefs)
+
+    def pages(self) -> Iterator[tuple[str, str, list[str]]]:
+        """
+            Yields (url, title, paragraphs) for each page crawled. At
+            most workers * 2 fetches are in flight, so a slow consumer
+            holds back the crawl rather than buffering pages.
+        """
+        from requests.exceptions import RequestException
+        queue = deque([(self.seed, 0)])
+        seen = {self.seed}
+        scheduled = 0
+        pending: dict[Future, tuple[str, int]] = {}
+        window = self.workers * 2
+        executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix='crawler'
+        )
+        try:
+            while queue or pending:
+                while queue and len(pending) < window \
+                        and scheduled < self.max_pages:
+                    url, depth = queue.popleft()
+                    pending[executor.submit(self._fetch, url)] = (url, depth)
+                    scheduled += 1
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url, depth = pending.pop(future)
+                    try:
+                        title, content, links = future.result()
+                    except (RequestException, OSError) as e:
+                        log.warning(f'Skipping {url}, failed to fetch: {e}')
+                        continue
+                    if depth < self.depth:
+                        for link in links:
+                            if link not in seen:
+                                seen.add(link)
+                                queue.append((link, depth + 1))
+                    log.debug(f'Crawled {url} at depth {depth}')
+                    yield url, title, content
+        finally:
+            # Stop fetching if the consumer stops early
+            executor.shutdown(wait=False, cancel_futures=True)
+        log.info(f'Crawl of {self.seed} finished after {scheduled} pages')
@@ -0,0 +1,243 @@
+import re
+import os
+import bz2
+import json
+import logging
+from pathlib import Path
+from itertools import islice
+from typing import Iterator
+from xml.etree.ElementTree import iterparse
+from spacy.language import Language
+
+from utils import parse_document, chunked
+from results import TokenTable
+from constants import BATCH_SIZE, SHARD_SIZE
+
+
+log = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = 'checkpoint.json'
+# Only pages in the main namespace are articles
+ARTICLE_NAMESPACE = '0'
+
+_COMMENT = re.compile(r'<!--.*?-->', re.DOTALL)
+_REF = re.compile(
+    r'<ref[^>/]*/>|<ref[^>]*>.*?</ref>', re.DOTALL | re.IGNORECASE
+)
+_TAG = re.compile(r'</?\w+[^>]*>')
+# Innermost templates and tables, removed repeatedly to handle nesting
+_TEMPLATE = re.compile(r'\{\{[^{}]*\}\}')
+_TABLE = re.compile(r'\{\|(?:(?!\{\|).)*?\|\}', re.DOTALL)
+# Links to files, images and categories are dropped with their caption
+_MEDIA_LINK = re.compile(
+    r'\[\[(?:File|Image|Category):'
+    r'[^\[\]]*(?:\[\[[^\[\]]*\]\][^\[\]]*)*\]\]',
+    re.IGNORECASE
+)
+_LINK = re.compile(r'\[\[(?:[^|\[\]]*\|)?([^\[\]]*)\]\]')
+_EXTERNAL_LINK = re.compile(r'\[(?:https?:)?//[^\s\]]+\s?([^\]]*)\]')
+_EMPHASIS = re.compile(r"'{2,}")
+_HEADING = re.compile(r'^=+.*=+\s*$', re.MULTILINE)
+_LIST_ITEM = re.compile(r'^[*#:;].*$', re.MULTILINE)
+_BLANK_LINES = re.compile(r'\n\s*\n')
+
+
+def _local(tag:str) -> str:
+    """Strip the export namespace from an element tag"""
+    return tag.rpartition('}')[2]
+
+def _remove_nested(pattern:re.Pattern, text:str) -> str:
+    while True:
+        text, count = pattern.subn('', text)
+        if not count:
+            return text
+
+def strip_markup(wikitext:str) -> list[str]:
+    """Reduce wiki markup to the plain text of each paragraph"""
+    text = _COMMENT.sub('', wikitext)
+    text = _REF.sub('', text)
+    text = _remove_nested(_TEMPLATE, text)
+    text = _remove_nested(_TABLE, text)
+    text = _MEDIA_LINK.sub('', text)
+    text = _LINK.sub(r'\1', text)
+    text = _EXTERNAL_LINK.sub(r'\1', text)
+    text = _TAG.sub('', text)
+    text = _EMPHASIS.sub('', text)
+    text = _HEADING.sub('', text)
+    text = _LIST_ITEM.sub('', text)
+    paragraphs = (
+        ' '.join(paragraph.split())
+        for paragraph in _BLANK_LINES.split(text)
+    )
+    return [paragraph for paragraph in paragraphs if paragraph]
+
+def iter_pages(dump_path:str) -> Iterator[tuple[str, str, str]]:
+    """
+        Yields (id, title, wikitext) for each article in a bz2 xml dump.
+        The dump is decompressed and parsed as a stream and each page
+        is cleared once read, so memory use stays constant.
+    """
+    with bz2.open(dump_path, 'rb') as file:
+        events = iterparse(file, events=('start', 'end'))
+        _, root = next(events)
+        page = {}
+        for event, element in events:
+            if event != 'end':
+                continue
+            tag = _local(element.tag)
+            if tag == 'page':
+                if page.get('ns') == ARTICLE_NAMESPACE \
+                        and 'redirect' not in page:
+                    yield page['id'], page['title'], page.get('text', '')
+                page = {}
+                # Drop the page from the tree, the root would otherwise
+                # keep a reference to every page read so far.
+                root.clear()
+            elif tag in ('title', 'ns', 'text', 'redirect'):
+                page[tag] = element.text or ''
+            elif tag == 'id' and 'id' not in page:
+                # The first id is the page's, later ones are revisions
+                page['id'] = element.text
+
+def iter_articles(
+        dump_path:str, skip:int=0
+    ) -> Iterator[tuple[str, tuple]]:
+    """
+        Yields (text, (id, title, pages)) for every article with any
+        text left once markup has been stripped, where pages is the
+        number of pages read so far. The first skip pages are passed
+        over without stripping them.
+    """
+    pages = islice(iter_pages(dump_path), skip, None)
+    for position, (page_id, title, wikitext) in enumerate(pages, skip + 1):
+        paragraphs = strip_markup(wikitext)
+        if paragraphs:
+            yield '\n'.join(paragraphs), (page_id, title, position)
+
+
+class Checkpoint:
+    """
+        Progress of a dump run, saved each time a shard is completed.
+        Articles after the last completed shard are parsed again when
+        the run resumes.
+    """
+    def __init__(self, output_dir:str, dump_path:str):
+        self.path = Path(output_dir, CHECKPOINT_FILE)
+        self.dump = os.path.abspath(dump_path)
+        self.articles = 0
+        self.shard = 0
+        # Pages of the dump read up to the last completed shard
+        self.pages = 0
+
+    def load(self):
+        if not self.path.exists():
+            return
+        with open(self.path, 'r', encoding='utf-8') as file:
+            state = json.load(file)
+        if state['dump'] != self.dump:
+            raise ValueError(
+                f'{self.path.parent} holds results for {state["dump"]}, '
+                'use another output directory'
+            )
+        self.articles = state['articles']
+        self.shard = state['shard']
+        self.pages = state['pages']
+        log.info(
+            f'Resuming dump at article {self.articles}, shard {self.shard}'
+        )
+
+    def save(self, articles:int, shard:int, pages:int):
+        self.articles, self.shard, self.pages = articles, shard, pages
+        state = {
+            'dump': self.dump, 'articles': articles, 'shard': shard,
+            'pages': pages
+        }
+        temp = self.path.with_name(f'{self.path.name}.tmp')
+        with open(temp, 'w', encoding='utf-8') as file:
+            json.dump(state, file)
+        os.replace(temp, self.path)
+
+
+class ShardWriter:
+    """
+        Writes parsed articles as json lines into numbered shards. A
+        shard is written to a temp file and only renamed into place
+        once complete, so a shard file on disk is never partial.
+    """
+    def __init__(self, output_dir:str, checkpoint:Checkpoint, size:int):
+        self.output_dir = output_dir
+        self.checkpoint = checkpoint
+        self.size = size
+        self.articles = checkpoint.articles
+        self.shard = checkpoint.shard
+        self.pages = checkpoint.pages
+        self._count = 0
+        self._file = None
+
+    def _path(self, shard:int) -> Path:
+        return Path(self.output_dir, f'tokens-{shard:05d}.jsonl')
+
+    def write(
+            self, page_id:str, title:str, parsed:TokenTable, pages:int
+        ):
+        if self._file is None:
+            temp = self._path(self.shard).with_suffix('.jsonl.tmp')
+            self._file = open(temp, 'w', encoding='utf-8')
+        record = {'id': page_id, 'title': title, 'rows': parsed.tolist()}
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._count += 1
+        self.articles += 1
+        self.pages = pages
+        if self._count >= self.size:
+            self.flush()
+
+    def flush(self):
+        """Complete the current shard and checkpoint it"""
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        path = self._path(self.shard)
+        os.replace(path.with_suffix('.jsonl.tmp'), path)
+        log.info(f'Wrote {self._count} articles to {path}')
+        self.shard += 1
+        self._count = 0
+        self.checkpoint.save(self.articles, self.shard, self.pages)
+
+def run_dump(
+        pipeline:Language, dump_path:str, output_dir:str,
+        batch_size:int=BATCH_SIZE, n_process:int=1,
+        shard_size:int=SHARD_SIZE, max_chars:int=None
+    ) -> int:
+    """
+        Parse every article in a wikipedia dump with nlp.pipe and write
+        their [word, entity, pos] rows to sharded json lines files. An
+        interrupted run resumes from the last completed shard. Returns
+        the total number of articles written.
+    """
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    checkpoint = Checkpoint(output_dir, dump_path)
+    checkpoint.load()
+    writer = ShardWriter(output_dir, checkpoint, shard_size)
+    log.info(
+        f'Starting dump {dump_path}, batch_size={batch_size} '
+        f'n_process={n_process} shard_size={shard_size}'
+    )
+    # Pages of completed shards are still read from the dump to find
+    # where to resume, but their markup is not stripped again.
+    articles = iter_articles(dump_path, skip=checkpoint.pages)
+    max_chars = min(max_chars or pipeline.max_length, pipeline.max_length)
+    docs = pipeline.pipe(
+        chunked(articles, max_chars), as_tuples=True,
+        batch_size=batch_size, n_process=n_process
+    )
+    tables = []
+    for doc, (page_id, title, pages, last) in docs:
+        tables.append(parse_document(doc))
+        if not last:
+            continue
+        writer.write(page_id, title, TokenTable.concat(tables), pages)
+        tables = []
+    writer.flush()
+    log.info(f'Finished dump, parsed {writer.articles} articles in total')
+    return writer.articles
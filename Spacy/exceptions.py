@@ -17,3 +17,12 @@ class PipelineNotLoaded(Exception):
         return "Cannot complete this process because a pipeline " \
                "has not been loaded"
 
+
+class JobCancelled(Exception):
+    """A job was cancelled or timed out while it was running"""
+    def __init__(self, name:str, timed_out:bool=False):
+        self.name = name
+        self.timed_out = timed_out
+        reason = 'timed out' if timed_out else 'was cancelled'
+        self.message = f'Job {name} {reason}'
+        super().__init__(self.message)
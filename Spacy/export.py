@@ -0,0 +1,144 @@
+from __future__ import annotations
+import os
+import csv
+import json
+import logging
+import numpy as np
+from pathlib import Path
+from threading import get_ident
+from typing import Callable, Iterator, Sequence
+
+from results import TokenTable, EntityGroups
+
+
+log = logging.getLogger(__name__)
+
+# Rows converted and written at a time
+CHUNK_ROWS = 50000
+TOKEN_FIELDS = ('word', 'entity', 'pos')
+GROUP_FIELDS = ('entity', 'label', 'count', 'first_offset')
+
+
+def columnar_available() -> bool:
+    """True if pyarrow is installed so parquet files can be written"""
+    try:
+        import pyarrow
+    except ImportError:
+        return False
+    return True
+
+def formats() -> dict[str, str]:
+    """Returns the description of every format that can be exported"""
+    available = {'csv': 'CSV File', 'jsonl': 'JSON Lines File'}
+    if columnar_available():
+        available['parquet'] = 'Parquet File'
+    available['npz'] = 'NumPy Columns File'
+    return available
+
+def fields(data:TokenTable | EntityGroups) -> tuple[str]:
+    return GROUP_FIELDS if isinstance(data, EntityGroups) else TOKEN_FIELDS
+
+def _chunks(
+        data:TokenTable | EntityGroups, indices:Sequence[int],
+        check:Callable
+    ) -> Iterator[list[list]]:
+    for start in range(0, len(indices), CHUNK_ROWS):
+        check()
+        yield list(data.rows(indices[start:start + CHUNK_ROWS]))
+
+def _write_csv(path:Path, data, indices, check):
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        for rows in _chunks(data, indices, check):
+            writer.writerows(rows)
+
+def _write_jsonl(path:Path, data, indices, check):
+    keys = fields(data)
+    with open(path, 'w', encoding='utf-8') as file:
+        for rows in _chunks(data, indices, check):
+            file.writelines(
+                json.dumps(dict(zip(keys, row)), ensure_ascii=False) + '\n'
+                for row in rows
+            )
+
+def _write_parquet(path:Path, data, indices, check):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    keys = fields(data)
+    writer = None
+    try:
+        for rows in _chunks(data, indices, check):
+            batch = pa.RecordBatch.from_arrays(
+                [pa.array(column) for column in zip(*rows)], names=keys
+            )
+            if writer is None:
+                writer = pq.ParquetWriter(str(path), batch.schema)
+            writer.write_batch(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        # Nothing to write, still leave a valid empty file
+        pq.write_table(pa.table({key: [] for key in keys}), str(path))
+
+def _write_npz(path:Path, data, indices, check):
+    """
+        Columns are taken straight from the model, token tables keep
+        their text buffer and label codes rather than one string per
+        row.
+    """
+    check()
+    indices = np.asarray(indices, dtype=np.intp)
+    if isinstance(data, EntityGroups):
+        columns = {
+            'entity': np.array(data.texts, dtype=str)[indices],
+            'label': np.array(data.labels, dtype=str)[indices],
+            'count': np.array(data.counts, dtype=np.int64)[indices],
+            'first_offset': np.array(data.first, dtype=np.int64)[indices]
+        }
+    else:
+        columns = {
+            'text': np.array(data.text),
+            'idx': data.idx[indices], 'length': data.length[indices],
+            'ent': data.ent[indices], 'pos': data.pos[indices],
+            'ent_labels': np.array(data.ent_labels, dtype=str),
+            'pos_labels': np.array(data.pos_labels, dtype=str)
+        }
+    with open(path, 'wb') as file:
+        np.savez_compressed(file, **columns)
+
+WRITERS = {
+    'csv': _write_csv,
+    'jsonl': _write_jsonl,
+    'parquet': _write_parquet,
+    'npz': _write_npz
+}
+
+def export_table(
+        data:TokenTable | EntityGroups, path:str, indices:Sequence[int]=None,
+        fmt:str=None, check:Callable=lambda: None
+    ) -> int:
+    """
+        Write rows of a results table to path, in the format given by
+        fmt or by the file extension. Rows are converted in chunks and
+        written to a temp file that replaces path once complete, so a
+        partial export is never left behind. check is called between
+        chunks and may raise to abandon the export. Returns the number
+        of rows written.
+    """
+    path = Path(path)
+    fmt = (fmt or path.suffix.lstrip('.')).lower()
+    if fmt not in WRITERS:
+        raise ValueError(f'Unsupported export format: {fmt}')
+    if indices is None:
+        indices = range(len(data))
+    temp = path.parent / f'{path.name}.{os.getpid()}.{get_ident()}.tmp'
+    log.debug(f'Exporting {len(indices)} rows to {path} as {fmt}')
+    try:
+        WRITERS[fmt](temp, data, indices, check)
+        os.replace(temp, path)
+    finally:
+        if temp.exists():
+            temp.unlink()
+    log.info(f'Exported {len(indices)} rows to {path}')
+    return len(indices)
@@ -0,0 +1,178 @@
+import re
+import logging
+from html.parser import HTMLParser
+
+
+log = logging.getLogger(__name__)
+
+# Id of the element that holds the article on wikipedia pages
+CONTENT_ID = 'mw-content-text'
+# Elements that never have an end tag
+VOID_TAGS = frozenset((
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link',
+    'meta', 'param', 'source', 'track', 'wbr'
+))
+# Start tags that close an open paragraph, as browsers do
+CLOSES_P = frozenset((
+    'address', 'article', 'aside', 'blockquote', 'details', 'div', 'dl',
+    'fieldset', 'figcaption', 'figure', 'footer', 'form', 'h1', 'h2',
+    'h3', 'h4', 'h5', 'h6', 'header', 'hgroup', 'hr', 'main', 'menu',
+    'nav', 'ol', 'p', 'pre', 'section', 'table', 'ul'
+))
+# Tags that stop the search for a paragraph to close
+SCOPE_TAGS = frozenset((
+    'applet', 'button', 'caption', 'html', 'marquee', 'object', 'table',
+    'td', 'template', 'th'
+))
+FEED_SIZE = 64 * 1024
+_CHARSET = re.compile(
+    rb'<meta[^>]+charset=["\']?([\w-]+)', re.IGNORECASE
+)
+
+
+class ContentExtractor(HTMLParser):
+    """
+        Streaming extractor for the title and the text of one tag type.
+        Only tags inside the main content container are kept, unless
+        the page has no such container in which case every match is.
+        No tree is built, text is collected straight from tag events,
+        but the names of the open tags are kept so that stray end tags
+        are ignored and paragraphs are closed where browsers close
+        them. The href of every link inside the container is kept too.
+    """
+    def __init__(self, tag:str='p', content_id:str=CONTENT_ID):
+        super().__init__(convert_charrefs=True)
+        self.tag = tag
+        self.content_id = content_id
+        self.title = None
+        self.found_container = False
+        self.content = []  # matches inside the container
+        self.everything = []  # matches anywhere, used as a fallback
+        self.links = []  # hrefs inside the container
+        self._in_title = False
+        self._title_parts = []
+        # Names of the open tags, and the positions in it of the
+        # container and of the outermost tag being collected
+        self._open = []
+        self._container_at = None
+        self._tag_at = None
+        self._parts = []
+
+    def handle_starttag(self, tag:str, attrs:list[tuple]):
+        if tag == 'title' and self.title is None:
+            self._in_title = True
+        if tag in VOID_TAGS:
+            return
+        if tag in CLOSES_P:
+            self._close_paragraph()
+        if not self.found_container and ('id', self.content_id) in attrs:
+            self.found_container = True
+            self._container_at = len(self._open)
+        if tag == 'a' and self._container_at is not None:
+            href = dict(attrs).get('href')
+            if href:
+                self.links.append(href)
+        if tag == self.tag and self._tag_at is None:
+            self._tag_at = len(self._open)
+        self._open.append(tag)
+
+    def handle_startendtag(self, tag:str, attrs:list[tuple]):
+        # Self closing tags such as <br/> never change the depth
+        pass
+
+    def handle_endtag(self, tag:str):
+        if tag == 'title' and self._in_title:
+            self._in_title = False
+            self.title = ''.join(self._title_parts)
+        if tag in VOID_TAGS or tag not in self._open:
+            return  # stray end tags close nothing
+        self._pop_to(len(self._open) - 1 - self._open[::-1].index(tag))
+
+    def handle_data(self, data:str):
+        if self._in_title:
+            self._title_parts.append(data)
+        if self._tag_at is not None:
+            self._parts.append(data)
+
+    def _close_paragraph(self):
+        """Close the innermost open paragraph that is in scope"""
+        for i in range(len(self._open) - 1, -1, -1):
+            if self._open[i] == 'p':
+                self._pop_to(i)
+                return
+            if self._open[i] in SCOPE_TAGS:
+                return
+
+    def _pop_to(self, position:int):
+        """Close the open tags from the innermost down to position"""
+        while len(self._open) > position:
+            self._open.pop()
+            if len(self._open) == self._tag_at:
+                self._tag_at = None
+                text = ''.join(self._parts)
+                self._parts = []
+                self.everything.append(text)
+                if self._container_at is not None:
+                    self.content.append(text)
+            if len(self._open) == self._container_at:
+                self._container_at = None
+
+    @property
+    def done(self) -> bool:
+        """True once the title and the whole container have been read"""
+        return self.found_container and self._container_at is None \
+            and self.title is not None
+
+    def result(self) -> tuple[str, list[str], list[str]]:
+        self.close()
+        # Tags left open at the end of the page are closed there
+        self._pop_to(0)
+        content = self.content if self.found_container else self.everything
+        return self.title, content, self.links
+
+
+def decode_html(html:bytes) -> str:
+    """Decode a page using the charset it declares, utf-8 otherwise"""
+    match = _CHARSET.search(html[:2048])
+    encoding = match.group(1).decode() if match else 'utf-8'
+    try:
+        return html.decode(encoding, errors='replace')
+    except LookupError:
+        return html.decode('utf-8', errors='replace')
+
+def extract_page(
+        html:bytes | str, search_for:str='p'
+    ) -> tuple[str, list[str], list[str]]:
+    """
+        Returns the page title, the text of each search_for tag and the
+        hrefs of the links in the main content container.
+    """
+    if isinstance(html, bytes):
+        html = decode_html(html)
+    extractor = ContentExtractor(tag=search_for)
+    # Feed in blocks so the rest of the page can be skipped once the
+    # content container has closed.
+    for i in range(0, len(html), FEED_SIZE):
+        extractor.feed(html[i:i + FEED_SIZE])
+        if extractor.done:
+            break
+    return extractor.result()
+
+def extract_content(
+        html:bytes | str, search_for:str='p'
+    ) -> tuple[str, list[str]]:
+    """Returns the page title and the text of each search_for tag"""
+    title, content, _ = extract_page(html, search_for)
+    return title, content
+
+def extract_content_soup(
+        html:bytes | str, search_for:str='p'
+    ) -> tuple[str, list[str]]:
+    """
+        Reference extraction with a full BeautifulSoup parse of the
+        page. Kept for comparison in benchmarks.
+    """
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+    content = [item.get_text() for item in soup.find_all(search_for)]
+    return soup.title.string, content
@@ -50,6 +50,15 @@ class AddressBar(ttk.Frame):
         self.begin_btn.pack(
             side='left', fill='y', padx=5, pady=5, before=self.input_field
         )
+        # Crawl the articles linked from the address button
+        self.crawl_btn = ImageButton(
+            self, img_fn=f'forward_{colour}.png', img_size=img_size,
+            text='Crawl', compound=compound,
+            style=style, command=self.on_crawl_btn
+        )
+        self.crawl_btn.pack(
+            side='left', fill='y', pady=5, before=self.input_field
+        )
         # Import from file button
         self.import_btn = ImageButton(
             self, img_fn=f'import_{colour}.png', img_size=img_size,
@@ -57,6 +66,11 @@ class AddressBar(ttk.Frame):
             command=self.import_file, style=style
         )
         self.import_btn.pack(side='right', padx=5, pady=5)
+        # Cancel button replaces the import button while searching
+        self.cancel_btn = ttk.Button(
+            self, text='Cancel', style='AddressBar.TButton',
+            cursor='hand2', command=self.master.cancel_job
+        )
 
     def import_file(self):
         """File button has been clicked"""
@@ -68,17 +82,25 @@ class AddressBar(ttk.Frame):
         log.debug(f'Address bar disabled = {searching}')
         state = 'disabled' if searching else 'normal'
         self.begin_btn.config(state=state)
+        self.crawl_btn.config(state=state)
         self.import_btn.config(state=state)
         if searching:
             self.master.notebook.results_tab.tree.state(('disabled',))
             self.progress_bar.pack(self.input_field.pack_info())
             self.progress_bar.start(10)
             self.input_field.pack_forget()
+            self.cancel_btn.pack(self.import_btn.pack_info())
+            self.import_btn.pack_forget()
             return
         self.master.notebook.results_tab.tree.state(('!disabled',))
+        self.import_btn.pack(self.cancel_btn.pack_info())
+        self.cancel_btn.pack_forget()
         self.input_field.pack(self.progress_bar.pack_info())
         self.progress_bar.pack_forget()
         self.progress_bar.stop()
 
     def on_start_btn(self):
         self.master.nlp(self.address.get())
+
+    def on_crawl_btn(self):
+        self.master.nlp(self.address.get(), crawl=True)
@@ -1,18 +1,35 @@
 import logging
+import numpy as np
 import tkinter as tk
-from tkinter import ttk
+from tkinter import ttk, messagebox
+from pathlib import Path
+from datetime import datetime
+from collections import deque
+from typing import Iterator
 
 from .widgets import (
-    ImageButton, CustomTreeView, CustomMessageBox,
+    ImageButton, CustomTreeView, VirtualTreeView, CustomMessageBox,
     RadioSetting, TextSetting, CheckBoxSetting,
     ScrollableFrame
 )
-from utils import parity
-from constants import WIKI
+from utils import parity, unique_path
+from results import TokenTable, EntityGroups, NO_LABEL
+from stats import Statistics
+from search import InvertedIndex
+from export import export_table
+from jobs import Job
+from constants import WIKI, ENTITY_COLOURS, COLOUR_MODES
 
 
 log = logging.getLogger(__name__)
 
+# Characters inserted into the content field per idle callback
+RENDER_CHUNK = 16384
+# Characters either side of the visible text whose entities are tagged
+TAG_MARGIN = 4096
+TOKEN_HEADINGS = ('words', 'entity type', 'part of speech')
+GROUP_HEADINGS = ('entity', 'entity type', 'count', 'first offset')
+
 
 class Notebook(ttk.Notebook):
     """Tkinter frame that ouputs results from spacy"""
@@ -24,11 +41,15 @@ class Notebook(ttk.Notebook):
         self.settings_tab = SettingsTab(self)
         self.results_tab = ResultsTab(self)
         self.contents_tab = ContentTab(self)
+        self.stats_tab = StatsTab(self)
+        self.history_tab = HistoryTab(self)
         self.help_tab = HelpTab(self)
         self.test_tab = TestTab(self)
         # Show notebook tabs
         self.add(self.results_tab, text='Results')
         self.add(self.contents_tab, text='Content')
+        self.add(self.stats_tab, text='Statistics')
+        self.add(self.history_tab, text='History')
         self.add(self.legend_tab, text='Legend')
         self.add(self.settings_tab, text='Settings')
         # self.add(self.test_tab, text='Testing')
@@ -80,13 +101,19 @@ class ResultsTab(NotebookTab):
             compound=compound, command=self.show_filter_msgbox
         ).pack(side='right', pady=5)
         # Create treeview widget
-        self.tree = CustomTreeView(
-            self, style='Treeview', anchor='w',
-            headings=('words', 'entity type', 'part of speech')
+        self.tree = VirtualTreeView(
+            self, style='Treeview', anchor='w', headings=TOKEN_HEADINGS
         )
         self.tree.pack(
             side='left', fill='both', expand=True
         )
+        self.settings = master.settings_tab
+        self.grouped = None
+        self._show_columns(grouped=False)
+        # Search index over the token rows, the tree only holds the
+        # token table itself when entities aren't grouped.
+        self.index = InvertedIndex()
+        self._tables = []
         # TODO: could edit this to use a save from the config file
         self.tree.set_filter(
             hidden_ents=[], hidden_pos=[], update=False
@@ -94,6 +121,9 @@ class ResultsTab(NotebookTab):
         self.tree.bind(
             '<Double-Button-1>', self._on_tree_select, add=True
         )
+        self.tree.bind(
+            '<<TreeviewSelect>>', self._on_row_select, add=True
+        )
 
     def _on_tree_select(self, event=None):
         # Get selected item from treeview
@@ -105,6 +135,19 @@ class ResultsTab(NotebookTab):
         self.root.addbar.address.set(WIKI + word)
         self.root.addbar.begin_btn.invoke()
 
+    def _on_row_select(self, event=None):
+        """Scroll the content to the selected row's text"""
+        index = self.tree.selected_row
+        if index is None: return
+        data = self.tree.data
+        if self.grouped:
+            start = data.first[index]
+            end = start + len(data.texts[index])
+        else:
+            start = int(data.idx[index])
+            end = start + int(data.length[index])
+        self.master.contents_tab.show_span(start, end)
+
     def show_filter_msgbox(self):
         # Not happy with constructing the msgbox every time,
         # however the work around is painful and time consuming.
@@ -112,27 +155,95 @@ class ResultsTab(NotebookTab):
         msgbox = FilterMessageBox()
         msgbox.take_controls()
 
-    def update_tree(self, desc:str, data:list[list]):
+    def _show_columns(self, grouped:bool):
+        """Switch between token rows and grouped entity rows"""
+        if grouped == self.grouped:
+            return
+        self.grouped = grouped
+        if grouped:
+            self.tree._set_headings(GROUP_HEADINGS, anchor='w')
+            self.tree.configure(displaycolumns=GROUP_HEADINGS)
+            return
+        self.tree._set_headings(TOKEN_HEADINGS, anchor='w')
+        # Only show the columns the pipeline was configured to fill
+        columns = ['words']
+        if self.settings.entity_column.get():
+            columns.append('entity type')
+        if self.settings.pos_column.get():
+            columns.append('part of speech')
+        self.tree.configure(displaycolumns=columns)
+
+    def update_tree(self, desc:str, data:TokenTable):
         """Update treeview with new data"""
         if desc:
             self.head_desc.set(desc)
+        self._show_columns(self.settings.group_entities.get())
+        self.index.clear()
+        self.index.add(data)
+        self._tables = []
+        if self.grouped:
+            self._tables = [data]
+            data = EntityGroups.from_table(data)
         self.tree.update_tree(data=data)
 
-    def save(self, fp:str=''):
-        """Save output to csv file"""
-        log.debug('Exporting data to csv file')
-        settings = self.master.settings_tab
-        data = [
-            self.tree.item(row)['values'] \
-            for row in self.tree.get_children()
-        ]
-        if not fp:
-            fp = settings.auto_save_path.get()
-        fp += '/output.csv'
-        # export_to_csv(data, fp)
+    @property
+    def tokens(self) -> TokenTable:
+        """The token rows of the results, even when they are grouped"""
+        if not self.grouped:
+            return self.tree.data
+        if len(self._tables) > 1:
+            self._tables = [TokenTable.concat(self._tables)]
+        return self._tables[0] if self._tables else TokenTable.empty()
+
+    def append_rows(self, rows:TokenTable):
+        """Append streamed rows to the treeview"""
+        self.index.add(rows)
+        if self.grouped:
+            self._tables.append(rows)
+            # Counts of existing groups change, so regroup in place
+            self.tree.data.add(rows)
+            self.tree.model_changed()
+            return
+        self.tree.append_rows(rows)
+
+    def export(self, fp:str, fmt:str=None) -> Job:
+        """
+            Write the filtered results to fp on a background thread.
+            The rows come from the results model, not the widget.
+        """
+        data = self.tree.data
+        view = np.array(self.tree.view, dtype=np.intp)
+
+        def job_func(job:Job) -> int:
+            return export_table(data, fp, view, fmt, check=job.check)
+
+        def on_error(error:Exception):
+            messagebox.showerror(
+                title='Export Error',
+                message=f'Failed to export results to {fp}'
+            )
+
+        return self.root.io_jobs.submit(
+            job_func, name=f'export to {fp}', on_error=on_error
+        )
+
+    def save(self, fp:str='') -> Job:
+        """Save output to a new file in the auto save directory"""
+        fmt = self.settings.export_format.get()
+        directory = fp or self.settings.auto_save_path.get()
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        log.debug(f'Auto saving results to {directory} as {fmt}')
+        return self.export(
+            unique_path(directory, prefix='output', ext=fmt), fmt
+        )
 
 
 class ContentTab(NotebookTab):
+    """
+        Parsed text with its entities coloured. Text is inserted in
+        chunks on idle so large documents don't block the GUI, and
+        entity tags are only applied around the visible region.
+    """
     def __init__(self, master, title='Content', desc=''):
         log.debug('Initializing content tab')
         super().__init__(master, title=title, desc=desc)
@@ -146,12 +257,327 @@ class ContentTab(NotebookTab):
             command=self.content_field.yview
         )
         self.scrollbar.pack(side='right', fill='y')
-        self.content_field.config(yscrollcommand=self.scrollbar.set)
+        self.content_field.config(yscrollcommand=self._on_scroll)
+        self.content_field.bind('<Configure>', self._schedule_tags, add=True)
+        self._chunks = deque()
+        self._rendering = False
+        self._rendered = 0  # characters inserted so far
+        self._tag_scheduled = False
+        self._tagged = None  # region the entity tags cover
+        # Tag name to entity label of every configured entity tag
+        self._entity_tags = {}
+        self.after(10, self._configure_selected)
+        self.clear_entities()
+
+    def _on_scroll(self, first:str, last:str):
+        self.scrollbar.set(first, last)
+        self._schedule_tags()
 
     def update_content(self, desc:str, content:str):
         self.head_desc.set(desc)
         self.content_field.delete('1.0', 'end')
-        self.content_field.insert('end', content)
+        self._chunks.clear()
+        self._rendered = 0
+        self.clear_entities()
+        self._enqueue(content)
+
+    def append_content(self, desc:str, content:str):
+        """Add the content of another page to the end of the field"""
+        self.head_desc.set(desc)
+        self._enqueue(content)
+
+    def _enqueue(self, content:str):
+        for start in range(0, len(content), RENDER_CHUNK):
+            self._chunks.append(content[start:start + RENDER_CHUNK])
+        if not self._rendering:
+            self._rendering = True
+            self.after_idle(self._render_chunk)
+
+    def _render_chunk(self):
+        # Each chunk is inserted in its own idle callback so events are
+        # handled in between.
+        if not self._chunks:
+            self._rendering = False
+            return
+        chunk = self._chunks.popleft()
+        self.content_field.insert('end - 1 chars', chunk)
+        self._rendered += len(chunk)
+        self._schedule_tags()
+        self.after_idle(self._render_chunk)
+
+    def clear_entities(self):
+        self._remove_entity_tags()
+        # Label to (starts, ends) offset arrays of its spans
+        self._spans = {}
+        self._span_offset = 0
+
+    def add_entities(self, data:TokenTable):
+        """Add the entity spans of a table that follows the last one"""
+        starts, ends, codes = data.spans()
+        starts = starts + self._span_offset
+        ends = ends + self._span_offset
+        for code, label in enumerate(data.ent_labels):
+            mask = codes == code
+            if not mask.any():
+                continue
+            parts = self._spans.setdefault(label, [])
+            parts.append((starts[mask], ends[mask]))
+        self._span_offset += len(data.text)
+        self._tagged = None
+        self._schedule_tags()
+
+    def _label_spans(self) -> Iterator[tuple[str, np.ndarray, np.ndarray]]:
+        for label, parts in self._spans.items():
+            if len(parts) > 1:
+                parts[:] = [(
+                    np.concatenate([starts for starts, _ in parts]),
+                    np.concatenate([ends for _, ends in parts])
+                )]
+            yield label, *parts[0]
+
+    def _tag(self, label:str) -> str:
+        tag = f'ent_{label}'
+        if tag not in self._entity_tags:
+            self._entity_tags[tag] = label
+            self._configure_entity(tag, self._colour_mode())
+            # Search highlights and the selection are drawn over it
+            self.content_field.tag_lower(tag)
+        return tag
+
+    def _colour_mode(self) -> str:
+        return self.nametowidget('').notebook.settings_tab.colour_mode.get()
+
+    def _configure_entity(self, tag:str, colour_mode:str):
+        palette = ENTITY_COLOURS[colour_mode]
+        # Option names are stored lowercased
+        labels = list(self.nametowidget('').cfg['entities'])
+        key = self._entity_tags[tag].lower()
+        position = labels.index(key) if key in labels else len(labels)
+        self.content_field.tag_configure(
+            tag, background=palette[position % len(palette)]
+        )
+
+    def _configure_selected(self, colour_mode:str=None):
+        colour_mode = colour_mode or self._colour_mode()
+        colours = self.nametowidget('').style.colours[colour_mode]
+        self.content_field.tag_configure(
+            'selected_token',
+            background=colours['foreground']['secondary'],
+            foreground=colours['background']['primary']
+        )
+
+    def recolour(self, colour_mode:str):
+        for tag in self._entity_tags:
+            self._configure_entity(tag, colour_mode)
+        self._configure_selected(colour_mode)
+
+    def _remove_entity_tags(self):
+        for tag in self._entity_tags:
+            self.content_field.tag_remove(tag, '1.0', 'end')
+        self._tagged = None
+
+    def _schedule_tags(self, event=None):
+        if self._tag_scheduled:
+            return
+        self._tag_scheduled = True
+        self.after_idle(self._tag_visible)
+
+    def _offset(self, index:str) -> int:
+        count = self.content_field.count('1.0', index, 'chars')
+        return count[0] if count else 0
+
+    def _tag_visible(self):
+        """Tag the entities around the visible part of the text"""
+        self._tag_scheduled = False
+        field = self.content_field
+        top = self._offset('@0,0')
+        bottom = self._offset(f'@0,{field.winfo_height()}')
+        bottom = min(bottom, self._rendered)
+        if self._tagged and self._tagged[0] <= top \
+                and bottom <= self._tagged[1]:
+            return
+        start = max(0, top - TAG_MARGIN)
+        end = min(self._rendered, bottom + TAG_MARGIN)
+        self._remove_entity_tags()
+        for label, starts, ends in self._label_spans():
+            # Spans don't overlap, so both arrays are sorted
+            first = np.searchsorted(ends, start, side='right')
+            last = np.searchsorted(starts, end, side='left')
+            if first >= last or label == NO_LABEL:
+                continue
+            # One call tags every span of the label in the region
+            field.tag_add(self._tag(label), *(
+                f'1.0 + {offset} chars'
+                for span in zip(
+                    starts[first:last].tolist(), ends[first:last].tolist()
+                )
+                for offset in span
+            ))
+        self._tagged = (start, end)
+
+    def show_span(self, start:int, end:int):
+        """Scroll to a span of the text and mark it"""
+        self.highlight('selected_token', [(start, end)])
+        self.see_offset(start)
+
+    def highlight(self, tag:str, spans:list[tuple[int, int]]):
+        """Replace the ranges of a tag with character offset spans"""
+        self.content_field.tag_remove(tag, '1.0', 'end')
+        if not spans:
+            return
+        # One call adds every range
+        self.content_field.tag_add(tag, *(
+            f'1.0 + {offset} chars' for span in spans for offset in span
+        ))
+
+    def see_offset(self, offset:int):
+        self.content_field.see(f'1.0 + {offset} chars')
+
+
+class StatsTab(NotebookTab):
+    """Counts and distributions of the labels in the results"""
+    def __init__(self, master, title='Statistics', desc=''):
+        log.debug('Initializing statistics tab')
+        super().__init__(master, title=title, desc=desc)
+        self.stats = Statistics()
+        self._scheduled = False
+        self._shown_paragraphs = 0
+        # Each treeview packs its scrollbar into its master
+        labels_frame = ttk.Frame(self)
+        labels_frame.pack(side='top', fill='both', expand=True)
+        self.labels_tree = CustomTreeView(
+            labels_frame, anchor='w', style='Treeview',
+            headings=('label', 'type', 'count', 'share', 'top words')
+        )
+        self.labels_tree.pack(side='left', fill='both', expand=True)
+        density_frame = ttk.Frame(self)
+        density_frame.pack(side='top', fill='both', expand=True)
+        self.density_tree = CustomTreeView(
+            density_frame, anchor='w', style='Treeview',
+            headings=('paragraph', 'words', 'entities', 'entity density')
+        )
+        self.density_tree.pack(side='left', fill='both', expand=True)
+
+    def reset(self):
+        """Clear the statistics for a new set of results"""
+        self.stats = Statistics()
+        self._shown_paragraphs = 0
+        self.density_tree.delete(*self.density_tree.get_children())
+        self._schedule()
+
+    def update_stats(self, data:TokenTable):
+        """Show the statistics of a whole table"""
+        self.reset()
+        self.add(data)
+
+    def add(self, data:TokenTable):
+        """Add a streamed table to the statistics"""
+        self.stats.add(data)
+        self._schedule()
+
+    def _schedule(self):
+        # Several streamed tables can arrive between redraws
+        if self._scheduled:
+            return
+        self._scheduled = True
+        self.after_idle(self._render)
+
+    def _render(self):
+        self._scheduled = False
+        stats = self.stats
+        rows = []
+        for column, kind in (('pos', 'part of speech'), ('ent', 'entity')):
+            for label, count, share in stats.labels(column):
+                top_words = ', '.join(stats.top_words(column, label))
+                rows.append([label, kind, count, f'{share:.1%}', top_words])
+        self.labels_tree.update_tree(rows)
+        # Paragraphs are only ever added, so only insert the new ones
+        position = len(self.density_tree.get_children())
+        for number, words, ents, share in stats.density(
+            self._shown_paragraphs
+        ):
+            self.density_tree.insert(
+                '', 'end', values=(number, words, ents, f'{share:.1%}'),
+                tags=(parity(position),)
+            )
+            position += 1
+        self._shown_paragraphs = stats.paragraphs
+        nouns = stats.counts['pos']['NOUN'] + stats.counts['pos']['PROPN']
+        verbs = stats.counts['pos']['VERB']
+        self.head_desc.set(
+            f'{stats.tokens} tokens, {nouns} nouns, {verbs} verbs, ' \
+            f'{stats.paragraphs} paragraphs'
+        )
+
+
+class HistoryTab(NotebookTab):
+    """Past runs that can be reopened without parsing them again"""
+    def __init__(self, master, title='History', desc=''):
+        log.debug('Initializing history tab')
+        super().__init__(master, title=title, desc=desc)
+        self.root = master.master
+        # Only runs containing this word or label are listed
+        self.matching = tk.StringVar()
+        ttk.Button(
+            self.head, text='Open', style='Head.TButton',
+            command=self.open_selected
+        ).pack(side='right', padx=5, pady=5)
+        ttk.Button(
+            self.head, text='Find', style='Head.TButton',
+            command=self.refresh
+        ).pack(side='right', pady=5)
+        find_field = ttk.Entry(self.head, textvariable=self.matching)
+        find_field.pack(side='right', padx=5, pady=5)
+        find_field.bind('<Return>', lambda e: self.refresh())
+        # The run id column is kept hidden to look up the selected run
+        self.tree = CustomTreeView(
+            self, anchor='w', style='Treeview',
+            headings=('run', 'date', 'title', 'source', 'tokens', 'pipeline')
+        )
+        self.tree.configure(
+            displaycolumns=('date', 'title', 'source', 'tokens', 'pipeline')
+        )
+        self.tree.pack(side='left', fill='both', expand=True)
+        self.tree.bind(
+            '<Double-Button-1>', lambda e: self.open_selected(), add=True
+        )
+        self.refresh()
+
+    def refresh(self):
+        """Reload the list of runs in the background"""
+        matching = self.matching.get().strip()
+        self.root.io_jobs.submit(
+            lambda job: self.root.history.runs(matching=matching),
+            name='list history', on_done=self._show_runs
+        )
+
+    def _show_runs(self, runs:list[tuple]):
+        rows = [
+            [
+                run_id, datetime.fromtimestamp(started).strftime(
+                    '%Y-%m-%d %H:%M'
+                ),
+                title, source, tokens, pipeline
+            ]
+            for run_id, started, title, source, tokens, pipeline in runs
+        ]
+        self.tree.update_tree(rows)
+        self.head_desc.set(f'{len(rows)} runs')
+
+    def open_selected(self):
+        """Show the selected run in the results tabs"""
+        values = self.tree.item(self.tree.focus(), option='values')
+        if not values: return
+        run_id = int(values[0])
+
+        def on_done(result:tuple[str, str, TokenTable]):
+            self.root.show_results(*result)
+            self.master.select(self.master.results_tab)
+
+        self.root.io_jobs.submit(
+            lambda job: self.root.history.load(run_id),
+            name=f'open run {run_id}', on_done=on_done
+        )
 
 
 class LegendTab(NotebookTab):
@@ -226,6 +652,14 @@ class SettingsTab(NotebookTab):
             var=self.auto_save_path
         )
         self.auto_save_path_entry.pack(pack_info)
+        self.export_format_radio = RadioSetting(
+            frame, label='Auto Save Format',
+            desc='File format of auto saved results, parquet needs ' \
+                 'pyarrow to be installed',
+            var=self.export_format,
+            options=('csv', 'jsonl', 'parquet', 'npz')
+        )
+        self.export_format_radio.pack(pack_info)
         self.default_url_entry = TextSetting(
             frame, label='Default URL',
             desc='URL in address bar on start up',
@@ -234,24 +668,100 @@ class SettingsTab(NotebookTab):
         self.default_url_entry.pack(pack_info)
         self.group_entities_checkbox = CheckBoxSetting(
             frame, label='Group Entities',
-            desc='Entities of the same type will appear on the same ' \
-                 'line',
+            desc='Show one row per distinct entity with the number of ' \
+                 'times it occurs, instead of one row per word',
             var=self.group_entities
         )
         self.group_entities_checkbox.pack(pack_info)
+        self.stream_results_checkbox = CheckBoxSetting(
+            frame, label='Stream Results',
+            desc='Show results for each paragraph as soon as it has ' \
+                 'been parsed',
+            var=self.stream_results
+        )
+        self.stream_results_checkbox.pack(pack_info)
+        self.keep_history_checkbox = CheckBoxSetting(
+            frame, label='Keep History',
+            desc='Store every result so it can be reopened from the ' \
+                 'history tab',
+            var=self.keep_history
+        )
+        self.keep_history_checkbox.pack(pack_info)
+        self.record_timings_checkbox = CheckBoxSetting(
+            frame, label='Record Timings',
+            desc='Log how long each stage of start up and parsing ' \
+                 'takes, press F3 to see them',
+            var=self.record_timings
+        )
+        self.record_timings_checkbox.pack(pack_info)
         self.colour_mode_radio = RadioSetting(
             frame, label='Colour Theme',
-            desc='The current colour theme (restart required)',
-            var=self.colour_mode, options=('light', 'dark')
+            desc='The current colour theme',
+            var=self.colour_mode, options=COLOUR_MODES
         )
         self.colour_mode_radio.pack(pack_info)
         self.pipeline_radio = RadioSetting(
             frame, label='NLP Pipeline',
-            desc='Preference for NLP Pipeline (restart required)',
+            desc='Preference for NLP Pipeline, the current one is ' \
+                 'used until the new one has loaded',
             options=('speed', 'accuracy'),
             var=self.pipeline,
         )
         self.pipeline_radio.pack(pack_info)
+        self.entity_column_checkbox = CheckBoxSetting(
+            frame, label='Entity Column',
+            desc='Find entity types, disabling this skips the entity ' \
+                 'recognizer',
+            var=self.entity_column
+        )
+        self.entity_column_checkbox.pack(pack_info)
+        self.pos_column_checkbox = CheckBoxSetting(
+            frame, label='Part Of Speech Column',
+            desc='Find parts of speech, disabling this skips the ' \
+                 'tagger',
+            var=self.pos_column
+        )
+        self.pos_column_checkbox.pack(pack_info)
+        self.keep_components_entry = TextSetting(
+            frame, label='Keep Components',
+            desc='Comma separated pipeline components to load even ' \
+                 'though no column uses them (restart required)',
+            var=self.keep_components
+        )
+        self.keep_components_entry.pack(pack_info)
+        self.disable_components_entry = TextSetting(
+            frame, label='Disable Components',
+            desc='Comma separated pipeline components to load but not ' \
+                 'run (restart required)',
+            var=self.disable_components
+        )
+        self.disable_components_entry.pack(pack_info)
+        self.nlp_workers_entry = TextSetting(
+            frame, label='NLP Worker Processes',
+            desc='Parse in this many background processes, 0 parses ' \
+                 'inside the app process (restart required)',
+            var=self.nlp_workers
+        )
+        self.nlp_workers_entry.pack(pack_info)
+        self.crawl_depth_entry = TextSetting(
+            frame, label='Crawl Depth',
+            desc='How many links away from the current article a ' \
+                 'crawl will go',
+            var=self.crawl_depth
+        )
+        self.crawl_depth_entry.pack(pack_info)
+        self.crawl_pages_entry = TextSetting(
+            frame, label='Crawl Page Limit',
+            desc='The most articles a single crawl will parse',
+            var=self.crawl_pages
+        )
+        self.crawl_pages_entry.pack(pack_info)
+        self.crawl_connections_entry = TextSetting(
+            frame, label='Crawl Connections',
+            desc='The most pages fetched from one site at the same time',
+            var=self.crawl_connections
+        )
+        self.crawl_connections_entry.pack(pack_info)
 
 
 # WIP
@@ -1,22 +1,37 @@
-import csv
+from __future__ import annotations
+import sys
+import time
 import logging
 import ctypes as ct
+from threading import Thread, Lock
 import tkinter as tk
 from tkinter import filedialog, messagebox
-from threading import Thread
 from urllib.parse import urlparse
 from appdirs import AppDirs
-from requests.exceptions import (
-    ConnectionError as RequestsConnectionError
+from typing import Callable, Iterator, TYPE_CHECKING
+from utils import (
+    parse_string_content, web_scrape, read_text_file, stream_parse,
+    split_paragraphs, paragraph_starts, http_cache, parse_cache,
+    history_store, pipeline_name, parse_cache_args, timings_path
 )
-from spacy.language import Language
-from spacy import load as get_pipe
-from utils import parse_string_content, web_scrape
+from results import TokenTable
+from assets import icons
+from timing import timers
+from pipeline import pipelines, settings_components
+from chunking import chunk_text, chunk_plan
+from export import formats
+from jobs import Dispatcher, JobScheduler, Job, JobState
 from constants import ASSETS_PATH
 from config import ConfigManager
 from .addressbar import AddressBar
+from .searchbar import SearchBar
 from .notebook import Notebook
 from .style import Style
+from .timingspanel import TimingsPanel
+
+if TYPE_CHECKING:
+    from spacy.language import Language
+    from workers import WorkerPool
 
 
 log = logging.getLogger(__name__)
@@ -26,14 +41,45 @@ class Root(tk.Tk):
     """Root of the GUI application"""
     _content_title: str
     _unparsed: str
-    _parsed: list[list[str]]
-    pipeline: Language
+    _parsed: TokenTable
+    pipeline: Language = None
+    # Set when parsing is done by worker processes
+    workers: WorkerPool = None
+    current_job: Job = None
 
     def __init__(self, name:str, dirs:AppDirs, restart_func):
         super().__init__()
         self.dirs = dirs
-        self.cfg = ConfigManager(dirs)
+        with timers.span('startup.config'):
+            self.cfg = ConfigManager(dirs)
+        timers.configure(
+            self.cfg['settings'].getboolean('record_timings'),
+            timings_path(dirs)
+        )
         self.restart = restart_func
+        self.http_cache = http_cache(dirs, self.cfg['settings'])
+        self.parse_cache = parse_cache(dirs, self.cfg['settings'])
+        # Long documents are parsed in chunks sized to the memory budget
+        self.chunking = chunk_plan(self.cfg['settings'])
+        # The number of worker processes only changes on restart
+        self.nlp_workers = self.cfg['settings'].getint('nlp_workers')
+        # Work runs on scheduler threads and reports back to the Tk
+        # thread through the dispatcher.
+        self.dispatch = Dispatcher(self)
+        self.dispatch.start()
+        self.scheduler = JobScheduler(
+            self.dispatch,
+            threads=max(1, self.nlp_workers)
+        )
+        # Exports and history get their own thread so they never wait
+        # behind parsing.
+        self.io_jobs = JobScheduler(self.dispatch, threads=1)
+        self.history = history_store(dirs)
+        icons.set_directory(f'{dirs.user_cache_dir}/icons')
+        # Each pipeline load gets a generation, only the latest one is
+        # swapped in.
+        self._pipeline_generation = 0
+        self._pipeline_lock = Lock()
 
         # Configure root window
         self.title(name)
@@ -42,21 +88,50 @@ class Root(tk.Tk):
         self.iconbitmap(f'{ASSETS_PATH}/icon.ico')
 
         # Create and show controls
-        self.notebook = Notebook(self)
-        self.addbar = AddressBar(self)
+        with timers.span('startup.notebook'):
+            self.notebook = Notebook(self)
+        with timers.span('startup.addressbar'):
+            self.addbar = AddressBar(self)
         self.addbar.pack(fill='x')
         self.notebook.pack(fill='both', expand=True)
 
         # Initialize style
-        self.style = Style(self)
+        with timers.span('startup.style'):
+            self.style = Style(self)
+        # Search bar is shown under the address bar on demand
+        self.searchbar = SearchBar(self)
+        self.bind_all('<Control-f>', self.searchbar.show, add=True)
 
         # Change titlebar to dark variant (win11 only)
-        if self.notebook.settings_tab.colour_mode.get() == 'dark':
+        settings = self.notebook.settings_tab
+        if settings.colour_mode.get() == 'dark':
             self.set_dark_titlebar()
 
+        # Theme and pipeline changes apply without a restart. They run
+        # on idle so the config has been updated by then.
+        settings.colour_mode.trace_add(
+            'write', lambda *args: self.after_idle(self.set_colour_mode)
+        )
+        for var in (
+            settings.pipeline, settings.entity_column, settings.pos_column
+        ):
+            var.trace_add(
+                'write', lambda *args: self.after_idle(self.load_pipeline)
+            )
+        settings.record_timings.trace_add(
+            'write', lambda *args: timers.configure(
+                settings.record_timings.get(), timings_path(dirs)
+            )
+        )
+
+        # Icons resized while building the window are added to the
+        # sprite sheet for the next start
+        self.after_idle(icons.save)
+
         # Debug Binds
         self.bind_all('<F1>', self.debug_show_geometry, add=True)
         self.bind_all('<F2>', self.debug_clear_results, add=True)
+        self.bind_all('<F3>', self.debug_show_timings, add=True)
 
     def debug_show_geometry(self, event=None):
         print(
@@ -64,14 +139,20 @@ class Root(tk.Tk):
             '\nHeight:', self.winfo_height()
         )
 
+    def debug_show_timings(self, event=None):
+        TimingsPanel(self)
+
     def debug_clear_results(self, event=None):
         nb = self.notebook
-        nb.results_tab.tree.delete(*nb.results_tab.tree.get_children())
-        nb.contents_tab.content_field.config(text='')
+        nb.results_tab.update_tree('', TokenTable.empty())
+        nb.stats_tab.reset()
+        nb.contents_tab.update_content('', '')
 
-    def set_dark_titlebar(self):
+    def set_dark_titlebar(self, dark:bool=True):
         """(Windows 11 Only) Change titlebar to dark variant"""
-        value = ct.c_int(2)
+        if sys.platform != 'win32':
+            return  # ctypes.windll only exists on windows
+        value = ct.c_int(2 if dark else 0)
         # I wish I knew how ctypes worked internally but I don't
         # TODO: learn ctypes to implement better commenting
         ct.windll.dwmapi.DwmSetWindowAttribute(
@@ -79,10 +160,157 @@ class Root(tk.Tk):
             20, ct.byref(value), ct.sizeof(value)
         )
 
+    def set_colour_mode(self):
+        """Restyle the open window for the chosen colour mode"""
+        colour_mode = self.notebook.settings_tab.colour_mode.get()
+        if colour_mode == self.style.colour_mode:
+            return
+        self.style.set_colour_mode(colour_mode)
+        self.set_dark_titlebar(colour_mode == 'dark')
+        self.after_idle(icons.save)
+
+    def load_pipeline(self):
+        """
+            Load the pipeline chosen in the settings on a background
+            thread. Until it has loaded the current pipeline stays in
+            service, and it is swapped in once no jobs are running so a
+            job never mixes the two.
+        """
+        self._pipeline_generation += 1
+        generation = self._pipeline_generation
+        settings = self.cfg['settings']
+        name = pipeline_name(self.notebook.settings_tab.pipeline.get())
+        components = settings_components(settings)
+        workers = self.nlp_workers
+        first_load = self.pipeline is None and self.workers is None
+        if first_load and workers > 0:
+            # Worker processes load their own pipelines, jobs submitted
+            # meanwhile wait in the pool's queue.
+            from workers import worker_pool
+            self.workers = worker_pool(
+                name, components, workers,
+                cache_args=parse_cache_args(self.dirs, settings)
+            )
+            return
+        if first_load:
+            # Disable GUI that requires pipeline to be loaded
+            self.addbar.update_gui_state(searching=True)
+        log.info(f'Preparing to load nlp pipeline {name}')
+
+        def load(retries=3):
+            # Loads run one at a time and are skipped once a newer
+            # choice has been made
+            with self._pipeline_lock:
+                for attempt in range(retries):
+                    if generation != self._pipeline_generation:
+                        log.debug(f'Skipped loading stale pipeline {name}')
+                        return
+                    log.debug('Attempting to load spacy pipeline: ' + name)
+                    try:
+                        with timers.span('startup.pipeline', pipeline=name):
+                            loaded = load_engine()
+                    except OSError:
+                        log.error(
+                            'Failed to load nlp pipeline trying again in '
+                            '3 seconds'
+                        )
+                        time.sleep(3)
+                        continue
+                    log.info('Successfully loaded nlp pipeline')
+                    self.dispatch.post(install, loaded)
+                    return
+            log.error('Exhausted retries for loading nlp pipeline')
+            self.dispatch.post(failed)
+
+        def load_engine() -> Language | WorkerPool:
+            if workers > 0:
+                from workers import worker_pool
+                pool = worker_pool(
+                    name, components, workers, keep_old=True,
+                    cache_args=parse_cache_args(self.dirs, settings)
+                )
+                pool.wait_ready()
+                return pool
+            if first_load:
+                return pipelines.get(name, **components)
+            return pipelines.swap(name, **components)
+
+        def install(loaded:Language | WorkerPool):
+            if generation != self._pipeline_generation:
+                discard(loaded)
+                return
+            if not self.scheduler.idle:
+                self.scheduler.when_idle(lambda: install(loaded))
+                return
+            if workers > 0:
+                old, self.workers = self.workers, loaded
+                discard(old)
+            else:
+                self.pipeline = loaded
+            log.info(f'Swapped in nlp pipeline {name}')
+            if first_load:
+                self.addbar.update_gui_state(searching=False)
+
+        def discard(loaded:Language | WorkerPool):
+            if workers > 0 and loaded not in (None, self.workers):
+                from workers import retire_pool
+                retire_pool(loaded)
+
+        def failed():
+            if first_load:
+                self.addbar.update_gui_state(searching=False)
+                return
+            messagebox.showerror(
+                title='Pipeline Error',
+                message=f"Couldn't load {name}, the current pipeline " \
+                        "is still in use."
+            )
+
+        # Load pipeline on a separate thread because it can
+        # take a while.
+        thread = Thread(target=load)
+        thread.daemon = True
+        thread.start()
+
     def start(self):
         """Start the GUI application"""
         self.mainloop()
 
+    def destroy(self):
+        # A restart builds a new root, so the job threads of this one
+        # are stopped rather than left waiting on their queues.
+        self.cancel_job()
+        self.scheduler.shutdown()
+        self.io_jobs.shutdown()
+        self.dispatch.stop()
+        super().destroy()
+
+    def parse(self, text:str, check:Callable=lambda: None) -> TokenTable:
+        """
+            Parse text with the worker pool or the loaded pipeline.
+            check is called between chunks and may raise to stop.
+        """
+        max_chars, batch_size = self.chunking
+        if self.workers is not None:
+            return self.workers.parse(text, max_chars=max_chars, check=check)
+        return parse_string_content(
+            pipeline=self.pipeline, string=text, cache=self.parse_cache,
+            max_chars=max_chars, batch_size=batch_size, check=check
+        )
+
+    def parse_stream(self, paragraphs:list[str]) -> Iterator[TokenTable]:
+        """Yields a token table for each paragraph as it is parsed"""
+        max_chars, _ = self.chunking
+        if self.workers is not None:
+            return self.workers.stream(
+                chunk for paragraph in paragraphs
+                for chunk in chunk_text(paragraph, max_chars)
+            )
+        return stream_parse(
+            self.pipeline, paragraphs, cache=self.parse_cache,
+            max_chars=max_chars
+        )
+
     def import_string(self) -> tuple[str, str]:
         """Import a string from a text file and return it"""
         log.debug('Importing string from text file')
@@ -101,106 +329,215 @@ class Root(tk.Tk):
     def export_results(self):
         """Export results from results tab to file"""
         log.debug('Exporting results to output file')
-        # Create and open the output file
-        file = filedialog.asksaveasfile(
+        # Choose the output file, it is written in the background
+        fp = filedialog.asksaveasfilename(
             initialfile='output.csv',
             defaultextension='.csv',
-            filetypes=(('CSV File', '*.csv'),)
+            filetypes=[
+                (desc, f'*.{ext}') for ext, desc in formats().items()
+            ]
         )
         # Return if no output file has been selected
-        if not file: return
-        # Collect data from results treeview
-        tree = self.notebook.results_tab.tree
-        tree_data = [
-            tree.item(row)['values'] \
-            for row in tree.get_children()
-        ]
-        # Write data to output file
-        writer = csv.writer(file)
-        writer.writerows(tree_data)
-        file.close()
-        log.info(f'Exported {len(tree_data)} rows to {file.name}')
+        if not fp: return
+        self.notebook.results_tab.export(fp)
 
-    def nlp(self, address:str):
-        """Collect, parse and output data to results tab"""
+    def show_results(self, title:str, unparsed:str, parsed:TokenTable):
+        """Show parsed content in the results, content and stats tabs"""
         nb = self.notebook
-        absolute_url = bool(urlparse(address).netloc)
-        self.addbar.update_gui_state(searching=True)
+        self._content_title, self._unparsed, self._parsed = \
+            title, unparsed, parsed
+        with timers.span('gui.update_content', chars=len(unparsed)):
+            nb.contents_tab.update_content(title, unparsed)
+            nb.contents_tab.add_entities(parsed)
+        with timers.span('gui.update_tree', tokens=len(parsed)):
+            nb.results_tab.update_tree(title, parsed)
+        with timers.span('gui.update_stats', tokens=len(parsed)):
+            nb.stats_tab.update_stats(parsed)
 
-        def connection_error(url:str):
-            log.error(f"couldn't establish connection with {url}")
-            self.addbar.update_gui_state(searching=False)
-            messagebox.showerror(
-                title='Connection Error',
-                message="Couldn't establish an internet connection. " \
-                        "Please check your internet connection and " \
-                        "try again."
-            )
+    def record_history(
+            self, source:str, title:str, unparsed:str, parsed:TokenTable,
+            **timings:float
+        ):
+        """Store a run in the history database in the background"""
+        pipeline = pipeline_name(self.cfg['settings']['pipeline'])
 
-        def pipeline_loading():
-            log.error('Attempted nlp before pipeline was loaded')
-            self.addbar.update_gui_state(searching=False)
-            messagebox.showerror(
-                title='Pipeline Error',
-                message='Cannot do that right now because the ' \
-                        'pipeline has not been loaded. Try again soon.'
+        def job_func(job:Job) -> int:
+            return self.history.record(
+                source, title, unparsed, pipeline, parsed, **timings
             )
 
-        def get_content_absolute():
-            return web_scrape(
-                address, remove_linebreak=True
-            )
+        self.io_jobs.submit(
+            job_func, name=f'record {source}',
+            on_done=lambda run_id: self.notebook.history_tab.refresh()
+        )
+
+    def cancel_job(self):
+        """Abandon the running search"""
+        if self.current_job is not None:
+            self.current_job.cancel()
+
+    def nlp(self, address:str, crawl:bool=False):
+        """
+            Collect, parse and output data to results tab. When crawl is
+            set the articles linked from address are parsed as well.
+        """
+        nb = self.notebook
+        settings = self.cfg['settings']
+        absolute_url = bool(urlparse(address).netloc)
+        streaming = nb.settings_tab.stream_results.get()
+        timeout = settings.getfloat('job_timeout_s')
+        self.addbar.update_gui_state(searching=True)
+
+        def get_pages(job:Job) -> Iterator[tuple[str, str | list[str]]]:
+            if crawl and absolute_url:
+                from crawl import Crawler
+                crawler = Crawler(
+                    address, depth=settings.getint('crawl_depth'),
+                    max_pages=settings.getint('crawl_pages'),
+                    cache=self.http_cache,
+                    per_host=settings.getint('crawl_connections')
+                )
+                pages = crawler.pages()
+                try:
+                    for _, title, content in pages:
+                        yield title, content
+                finally:
+                    pages.close()
+            elif absolute_url:
+                yield web_scrape(
+                    address, remove_linebreak=True, cache=self.http_cache
+                )
+            else:
+                yield read_text_file(address)
+
+        timings = {'fetch_s': 0.0, 'parse_s': 0.0}
 
-        def get_content_non_absolute():
+        def parse_page(job:Job, paragraphs:list[str]) -> TokenTable:
+            start = time.perf_counter()
             try:
-                with open(address, 'r') as file:
-                    title = address.split('/')[-1]
-                    content = file.read()
-            except FileNotFoundError:
-                return 'Content Not Found', ''
-            title = title.split('.')[0].replace('_', ' ').title()
-            return title, content
-
-        def thread_func():
+                with timers.span('search.parse') as span:
+                    table = parse_paragraphs(job, paragraphs)
+                    span.set(tokens=len(table))
+                # Scraped paragraphs have had their line breaks removed
+                # so the table is told where they start
+                return table.with_paragraphs(paragraph_starts(paragraphs))
+            finally:
+                timings['parse_s'] += time.perf_counter() - start
+
+        def parse_paragraphs(job:Job, paragraphs:list[str]) -> TokenTable:
+            if not streaming:
+                return self.parse("".join(paragraphs), check=job.check)
+            tables = []
+            results = self.parse_stream(paragraphs)
             try:
-                self._content_title, content = get_content_absolute() \
-                    if absolute_url else get_content_non_absolute()
-            except RequestsConnectionError:
-                connection_error()
-                return
-            self._unparsed = "".join(content)
+                for table in results:
+                    job.check()
+                    tables.append(table)
+                    self.dispatch.post(show_rows, job, table)
+            finally:
+                results.close()
+            return TokenTable.concat(tables)
+
+        def job_func(job:Job) -> tuple[str, str, TokenTable]:
+            with timers.span('search.job', address=address) as span:
+                title, text, table = collect(job)
+                span.set(chars=len(text), tokens=len(table))
+            return title, text, table
+
+        def collect(job:Job) -> tuple[str, str, TokenTable]:
+            titles, texts, tables = [], [], []
+            # Crawled pages are parsed as they arrive while the crawler
+            # fetches the next ones in the background.
+            start = time.perf_counter()
+            pages = get_pages(job)
             try:
-                self._parsed = parse_string_content(
-                    pipeline=self.pipeline,
-                    string=self._unparsed
-                )
-            except AttributeError:
-                pipeline_loading()
+                for title, content in pages:
+                    job.check()
+                    paragraphs = split_paragraphs(content)
+                    titles.append(title)
+                    texts.append("".join(paragraphs))
+                    if streaming:
+                        self.dispatch.post(
+                            show_content, job, page_title(titles), texts[-1],
+                            len(titles) > 1
+                        )
+                    tables.append(parse_page(job, paragraphs))
+            finally:
+                pages.close()
+            timings['fetch_s'] = \
+                time.perf_counter() - start - timings['parse_s']
+            return page_title(titles), "".join(texts), \
+                TokenTable.concat(tables)
+
+        def page_title(titles:list[str]) -> str:
+            if len(titles) < 2:
+                return titles[0] if titles else ''
+            return f'{titles[0]} and {len(titles) - 1} linked pages'
+
+        def show_content(job:Job, title:str, unparsed:str, append:bool):
+            if job.cancelled: return
+            if append:
+                nb.contents_tab.append_content(title, unparsed)
+                nb.results_tab.head_desc.set(title)
                 return
+            nb.contents_tab.update_content(title, unparsed)
+            nb.results_tab.update_tree(title, TokenTable.empty())
+            nb.stats_tab.reset()
+
+        def show_rows(job:Job, table:TokenTable):
+            if job.cancelled: return
+            nb.results_tab.append_rows(table)
+            nb.contents_tab.add_entities(table)
+            nb.stats_tab.add(table)
+
+        def on_done(result:tuple[str, str, TokenTable]):
             log.info('Finished parsing content')
+            if streaming:
+                self._content_title, self._unparsed, self._parsed = result
+            else:
+                self.show_results(*result)
+            self.addbar.update_gui_state(searching=False)
+            if nb.settings_tab.auto_save.get():
+                nb.results_tab.save()
+            if settings.getboolean('keep_history'):
+                self.record_history(address, *result, **timings)
 
-        def check_thread_finished(thread, ms:int):
-            if thread.is_alive():
-                self.after(ms, lambda: check_thread_finished(thread, ms))
+        def on_error(error:Exception):
+            from requests.exceptions import (
+                ConnectionError as RequestsConnectionError
+            )
+            self.addbar.update_gui_state(searching=False)
+            if isinstance(error, RequestsConnectionError):
+                log.error(f"couldn't establish connection with {address}")
+                messagebox.showerror(
+                    title='Connection Error',
+                    message="Couldn't establish an internet connection. " \
+                            "Please check your internet connection and " \
+                            "try again."
+                )
                 return
-            try:
-                output_result()
-            except AttributeError as e:
-                log.error(f'Attribute error: {e}')
+            if isinstance(error, AttributeError):
+                log.error('Attempted nlp before pipeline was loaded')
+                messagebox.showerror(
+                    title='Pipeline Error',
+                    message='Cannot do that right now because the ' \
+                            'pipeline has not been loaded. Try again soon.'
+                )
                 return
-
-        def output_result():
-            nb.contents_tab.update_content(
-                self._content_title, self._unparsed
-            )
-            nb.results_tab.update_tree(
-                self._content_title, self._parsed
+            messagebox.showerror(
+                title='Error', message=f'Failed to process {address}'
             )
+
+        def on_cancel(job:Job):
             self.addbar.update_gui_state(searching=False)
-            if nb.settings_tab.auto_save.get():
-                nb.results_tab.save()
+            if job.state == JobState.TIMED_OUT:
+                messagebox.showwarning(
+                    title='Timed Out',
+                    message=f'Gave up on {address} after {timeout:g} ' \
+                            'seconds.'
+                )
 
-        thread = Thread(target=thread_func)
-        thread.daemon = True
-        thread.start()
-        check_thread_finished(thread, ms=1000)
+        self.current_job = self.scheduler.submit(
+            job_func, name=address, timeout=timeout or None,
+            on_done=on_done, on_error=on_error, on_cancel=on_cancel
+        )
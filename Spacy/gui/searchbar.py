@@ -0,0 +1,162 @@
+import logging
+import numpy as np
+import tkinter as tk
+from tkinter import ttk
+
+from search import find
+from .widgets import ImageButton
+
+
+log = logging.getLogger(__name__)
+
+# Matches highlighted in the content either side of the current one
+HIGHLIGHT_WINDOW = 1000
+
+
+class SearchBar(ttk.Frame):
+    """
+        Find as you type bar. Matches come from the results tab's
+        search index and are highlighted in both the results and the
+        content tabs.
+    """
+    def __init__(self, master):
+        log.debug('Initializing search bar widget')
+        super().__init__(master, style='AddressBar.TFrame')
+        self.notebook = master.notebook
+        settings = self.notebook.settings_tab
+        self.query = tk.StringVar()
+        self.prefix = tk.BooleanVar(value=True)
+        self.case_sensitive = tk.BooleanVar(value=False)
+        self.status = tk.StringVar()
+        self.matches = np.zeros(0, dtype=np.intp)
+        self.current = -1
+        self._window = (0, 0)
+        self._scheduled = False
+        # Values for image buttons
+        colour = settings.colour_mode.get()
+        img_size = (16, 16)
+        style = 'AddressBarImg.TButton'
+        self.input_field = ttk.Entry(
+            self, style='AddressBar.TEntry', textvariable=self.query
+        )
+        self.input_field.pack(
+            side='left', fill='both', expand=True, padx=5, pady=5
+        )
+        ImageButton(
+            self, img_fn=f'backward_{colour}.png', img_size=img_size,
+            style=style, command=self.previous
+        ).pack(side='left', fill='y', pady=5)
+        ImageButton(
+            self, img_fn=f'forward_{colour}.png', img_size=img_size,
+            style=style, command=self.next
+        ).pack(side='left', fill='y', padx=5, pady=5)
+        ttk.Checkbutton(
+            self, text='Prefix', variable=self.prefix,
+            command=self._schedule
+        ).pack(side='left', padx=5)
+        ttk.Checkbutton(
+            self, text='Match Case', variable=self.case_sensitive,
+            command=self._schedule
+        ).pack(side='left', padx=5)
+        ttk.Label(
+            self, textvariable=self.status, width=14
+        ).pack(side='left', padx=5)
+        self.query.trace_add('write', lambda *args: self._schedule())
+        self.input_field.bind('<Return>', lambda e: self.next())
+        self.input_field.bind('<Shift-Return>', lambda e: self.previous())
+        self.input_field.bind('<Escape>', lambda e: self.hide())
+        self._setup_tag_colours()
+
+    def recolour(self, colour_mode:str):
+        self._setup_tag_colours()
+
+    def _setup_tag_colours(self):
+        colour_mode = self.notebook.settings_tab.colour_mode.get()
+        colours = self.master.style.colours[colour_mode]
+        fg, bg = colours['foreground'], colours['background']
+        field = self.notebook.contents_tab.content_field
+        field.tag_configure('match', background=bg['accent_1'])
+        field.tag_configure(
+            'current_match', background=fg['positive'],
+            foreground=bg['primary']
+        )
+        field.tag_raise('current_match', 'match')
+
+    def show(self, event=None):
+        self.pack(fill='x', after=self.master.addbar)
+        self.input_field.focus_set()
+        self.input_field.select_range(0, 'end')
+
+    def hide(self, event=None):
+        self.query.set('')
+        self.pack_forget()
+
+    def _schedule(self):
+        # Keystrokes typed before the GUI is idle are searched once
+        if self._scheduled:
+            return
+        self._scheduled = True
+        self.after_idle(self.search)
+
+    def search(self):
+        """Find the matches of the query and go to the first one"""
+        self._scheduled = False
+        results_tab = self.notebook.results_tab
+        tokens = results_tab.tokens
+        self.matches = find(
+            results_tab.index, tokens, self.query.get(),
+            prefix=self.prefix.get(),
+            case_sensitive=self.case_sensitive.get()
+        )
+        log.debug(
+            f'Searched for {self.query.get()!r}, {len(self.matches)} matches'
+        )
+        self._window = (0, 0)
+        if not results_tab.grouped:
+            results_tab.tree.set_matches(self.matches.tolist())
+        if not len(self.matches):
+            self.current = -1
+            self.status.set('No matches' if self.query.get() else '')
+            contents_tab = self.notebook.contents_tab
+            contents_tab.highlight('match', [])
+            contents_tab.highlight('current_match', [])
+            return
+        self.goto(0)
+
+    def _spans(self, rows:np.ndarray) -> list[tuple[int, int]]:
+        tokens = self.notebook.results_tab.tokens
+        starts = tokens.idx[rows]
+        return list(zip(
+            starts.tolist(), (starts + tokens.length[rows]).tolist()
+        ))
+
+    def goto(self, position:int):
+        """Show the match at a position in the list of matches"""
+        if not len(self.matches):
+            return
+        self.current = position % len(self.matches)
+        row = int(self.matches[self.current])
+        self.status.set(f'{self.current + 1} of {len(self.matches)}')
+        contents_tab = self.notebook.contents_tab
+        # Highlighting every match can be slow on large documents, so
+        # only those around the current match are highlighted.
+        start, end = self._window
+        if not start <= self.current < end:
+            start = max(0, self.current - HIGHLIGHT_WINDOW)
+            end = self.current + HIGHLIGHT_WINDOW
+            self._window = (start, end)
+            contents_tab.highlight(
+                'match', self._spans(self.matches[start:end])
+            )
+        span = self._spans(self.matches[self.current:self.current + 1])
+        contents_tab.highlight('current_match', span)
+        contents_tab.see_offset(span[0][0])
+        results_tab = self.notebook.results_tab
+        if not results_tab.grouped:
+            results_tab.tree.select_row(row)
+
+    def next(self):
+        self.goto(self.current + 1)
+
+    def previous(self):
+        self.goto(self.current - 1)
@@ -1,6 +1,6 @@
+import os
 import json
 import logging
-import tkinter as tk
 from tkinter import ttk, font as tkfont
 
 from constants import THEME_PATH
@@ -9,86 +9,154 @@ from utils import get_children
 
 log = logging.getLogger(__name__)
 
+THEME_FILE = 'theme.json'
+COLOURS_FILE = 'colours.json'
+# Options of the tk widgets the ttk theme doesn't reach, colours are
+# referenced the same way as in the theme file
+TK_WIDGETS = {
+    'Canvas': {'background': 'background-primary'},
+    'Text': {
+        'foreground': 'foreground-primary',
+        'background': 'background-primary',
+        'font': ('Segoe UI', 9), 'relief': 'flat', 'padx': 10, 'pady': 5,
+        'insertbackground': 'foreground-primary', 'insertwidth': 1
+    }
+}
+
+
+def _resolve(value, colours:dict):
+    """Returns the colour a 'group-shade' reference stands for"""
+    try:
+        group, shade = value.split('-')
+    except (ValueError, AttributeError):
+        return value
+    return colours.get(group, {}).get(shade, value)
+
+def compile_theme(theme:dict, colours:dict) -> dict:
+    """
+        Returns the theme and tk widget options with every colour
+        reference resolved against the colours of one colour mode.
+    """
+    settings = {}
+    for widget, sections in theme['settings'].items():
+        compiled = settings[widget] = {}
+        for section, content in sections.items():
+            match section:
+                case "configure":
+                    compiled[section] = {
+                        option: _resolve(value, colours)
+                        for option, value in content.items()
+                    }
+                case "map":
+                    # The last item of each entry is the value
+                    compiled[section] = {
+                        option: [
+                            [*item[:-1], _resolve(item[-1], colours)]
+                            for item in items
+                        ]
+                        for option, items in content.items()
+                    }
+                case "layout":
+                    compiled[section] = content
+                case _:
+                    log.warning(
+                        'Unknown section in theme file ' \
+                        f'{widget}-{section}'
+                    )
+    return {
+        'theme': {**theme, 'settings': settings},
+        'tk_widgets': {
+            widget: {
+                option: _resolve(value, colours)
+                for option, value in options.items()
+            }
+            for widget, options in TK_WIDGETS.items()
+        }
+    }
+
+def _source_key() -> list[int]:
+    return [
+        os.stat(os.path.join(THEME_PATH, filename)).st_mtime_ns
+        for filename in (THEME_FILE, COLOURS_FILE)
+    ]
+
+def load_theme(colour_mode:str, cache_path:str) -> tuple[dict, dict]:
+    """
+        Returns the colours and the compiled theme of a colour mode.
+        Compiled themes are cached in cache_path, keyed by the modified
+        times of the theme files, so they are only compiled again after
+        one of the files changes.
+    """
+    key = _source_key()
+    try:
+        with open(cache_path, 'r') as file:
+            cache = json.load(file)
+        if cache['key'] == key and colour_mode in cache['modes']:
+            return cache['colours'], cache['modes'][colour_mode]
+        if cache['key'] != key:
+            raise ValueError('Theme files have changed')
+    except (OSError, ValueError, KeyError):
+        cache = {'key': key, 'modes': {}}
+    log.info(f'Compiling {colour_mode} theme')
+    with open(os.path.join(THEME_PATH, COLOURS_FILE), 'r') as file:
+        cache['colours'] = json.load(file)
+    with open(os.path.join(THEME_PATH, THEME_FILE), 'r') as file:
+        theme = json.load(file)
+    compiled = compile_theme(theme, cache['colours'][colour_mode])
+    cache['modes'][colour_mode] = compiled
+    temp = f'{cache_path}.{os.getpid()}.tmp'
+    try:
+        with open(temp, 'w') as file:
+            json.dump(cache, file)
+        os.replace(temp, cache_path)
+    except OSError:
+        log.warning(f'Could not write the theme cache {cache_path}')
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+    return cache['colours'], compiled
+
 
 class Style(ttk.Style):
     """Custom tkinter style manager"""
     colours: dict
     theme: dict
-    
+
     def __init__(self, root):
         super().__init__(root)
         log.info('Preparing style manager')
         self.colour_mode = root.notebook.settings_tab.colour_mode.get()
-        self.colours = self._load_colour_file('colours.json')
-        self.theme = self._load_theme_file('theme.json')
-        self._prep_theme()
+        self.cache_path = f'{root.dirs.user_cache_dir}/theme.json'
+        self._load(self.colour_mode)
         self.theme_create(**self.theme)
         self.theme_use('theme')  # name of theme in theme.json
+        self._style_widgets()
         log.info('Successfully setup style manager')
 
-    def _convert_colour(self, value:str):
-        try:
-            colour_opt, colour_val = value.split('-')
-        except ValueError: return value
-        except AttributeError: return value
-        return self.colours[self.colour_mode][colour_opt][colour_val]
-
-    def _prep_configure(self, widget:str, configure:dict):
-        for option, value in configure.items():
-            colour = self._convert_colour(value)
-            self.theme['settings'][widget]['configure'][option] = colour
-
-    def _prep_map(self, widget:str, map:dict):
-        for option, value in map.items():
-            for item in value:
-                colour = self._convert_colour(item[1])
-                self.theme['settings'][widget]['map'][option][value.index(item)][1] = colour
+    def _load(self, colour_mode:str):
+        self.colours, compiled = load_theme(colour_mode, self.cache_path)
+        self.theme = compiled['theme']
+        self._tk_widgets = compiled['tk_widgets']
 
-    def _prep_tk_widget(self, widget):
-        colours = self.colours[self.colour_mode]
-        fg = colours['foreground']
-        bg = colours['background']
-        # This code is bad. TODO: Rewrite
-        if isinstance(widget, tk.Canvas):
-            widget.configure(
-                background=bg['primary']
-            )
-        if isinstance(widget, tk.Text):
-            widget.configure(
-                foreground=fg['primary'], background=bg['primary'],
-                font=('Segoe UI', 9), relief='flat', padx=10, pady=5,
-                insertbackground=fg['primary'], insertwidth=1
-            )
+    def set_colour_mode(self, colour_mode:str):
+        """
+            Switch the theme to another colour mode and restyle the
+            existing widgets. Widgets that hold colours or images of
+            their own are given the new mode through their recolour
+            method.
+        """
+        log.info(f'Switching colour mode to {colour_mode}')
+        self.colour_mode = colour_mode
+        self._load(colour_mode)
+        self.theme_settings('theme', self.theme['settings'])
+        self.theme_use('theme')
+        self._style_widgets(recolour=True)
 
-    def _prep_theme(self):
-        settings = self.theme['settings']
-        for widget, w_content in settings.items():
-            for section, s_content in w_content.items():
-                match section:
-                    case "configure":
-                        self._prep_configure(widget, s_content)
-                    case "map":
-                        self._prep_map(widget, s_content)
-                    case "layout":
-                        # ignore layout sections
-                        continue
-                    case _:
-                        log.warning(
-                            'Unknown section in theme file ' \
-                            f'{widget}-{section}'
-                        )
+    def _style_widgets(self, recolour:bool=False):
+        """Apply the tk widget options in one pass over the widgets"""
         for widget in get_children(self.master):
-            self._prep_tk_widget(widget)
-
-    def _load_colour_file(self, colours_filename:str):
-        log.debug('Loading colour file')
-        with open(
-            f'{THEME_PATH}/{colours_filename}', 'r'
-        ) as colour_file:
-            colours = json.load(colour_file)
-        return colours
-
-    def _load_theme_file(self, theme_filename:str):
-        with open(f'{THEME_PATH}/{theme_filename}', 'r') as theme_file:
-            theme = json.load(theme_file)
-        return theme
+            options = self._tk_widgets.get(widget.winfo_class())
+            if options:
+                widget.configure(**options)
+            if recolour and hasattr(widget, 'recolour'):
+                widget.recolour(self.colour_mode)
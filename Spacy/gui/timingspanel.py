@@ -0,0 +1,76 @@
+import logging
+import tkinter as tk
+from tkinter import ttk
+
+from timing import timers
+from constants import MAX_TIMINGS
+from .widgets import CustomTreeView
+
+
+log = logging.getLogger(__name__)
+
+HEADINGS = ('stage', 'wall ms', 'cpu ms', 'tokens', 'thread')
+
+
+class TimingsPanel(tk.Toplevel):
+    """
+        Debug window listing the latest stage timings. New records are
+        added while it is open, at most once per idle.
+    """
+    def __init__(self, root):
+        log.debug('Initializing timings panel')
+        super().__init__(root)
+        self.root = root
+        self.title('Stage Timings')
+        self.geometry('560x320')
+        colour_mode = root.notebook.settings_tab.colour_mode.get()
+        colours = root.style.colours[colour_mode]
+        self.configure(background=colours['background']['primary'])
+        self.status = tk.StringVar()
+        ttk.Label(self, textvariable=self.status).pack(
+            side='bottom', fill='x', padx=10, pady=5
+        )
+        frame = ttk.Frame(self)
+        frame.pack(fill='both', expand=True)
+        self.tree = CustomTreeView(frame, headings=HEADINGS)
+        self.tree.pack(side='left', fill='both', expand=True)
+        self.rows = [self._row(record) for record in timers.recent()]
+        self._scheduled = False
+        self._render()
+        timers.subscribe(self._on_record)
+        self.protocol('WM_DELETE_WINDOW', self.on_close)
+
+    @staticmethod
+    def _row(record:dict) -> list:
+        return [
+            record['stage'], f'{record["wall_s"] * 1000:.1f}',
+            f'{record["cpu_s"] * 1000:.1f}', record.get('tokens', ''),
+            record['thread']
+        ]
+
+    def _on_record(self, record:dict):
+        # Records can arrive on any thread
+        self.root.dispatch.post(self._add, record)
+
+    def _add(self, record:dict):
+        if not self.winfo_exists():
+            return  # closed while the record was being posted
+        self.rows.append(self._row(record))
+        del self.rows[:-MAX_TIMINGS]
+        if not self._scheduled:
+            self._scheduled = True
+            self.after_idle(self._render)
+
+    def _render(self):
+        self._scheduled = False
+        self.tree.update_tree(self.rows)
+        if self.rows:
+            self.tree.see(self.tree.get_children()[-1])
+        self.status.set(
+            f'{len(self.rows)} stages' if timers.enabled else
+            'Timing is off, turn on Record Timings in the settings'
+        )
+
+    def on_close(self):
+        timers.unsubscribe(self._on_record)
+        self.destroy()
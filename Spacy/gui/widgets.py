@@ -1,13 +1,21 @@
+import os
 import logging
+from bisect import bisect_right
+import numpy as np
 import tkinter as tk
 from tkinter import ttk
+from typing import Iterable
 
 from utils import image, up_list, parity
-from constants import ODD, EVEN
+from results import TokenTable, EntityGroups
+from constants import ODD, EVEN, COLOUR_MODES
 
 
 log = logging.getLogger(__name__)
 
+# Table types a treeview can show without converting them to lists
+TABLES = (TokenTable, EntityGroups)
+
 
 class ImageButton(ttk.Button):
     """ttk Button with an image"""
@@ -15,12 +23,24 @@ class ImageButton(ttk.Button):
             self, master, img_fn:str, img_size:tuple[int, int],
             style:str='TButton', **kw
         ):
+        self.img_fn = img_fn
+        self.img_size = img_size
         self.img = image(img_fn, img_size)
         super().__init__(
             master, image=self.img, cursor='hand2',
             style=style, **kw
         )
 
+    def recolour(self, colour_mode:str):
+        """Swap the image for its variant in another colour mode"""
+        stem, ext = os.path.splitext(self.img_fn)
+        name, _, mode = stem.rpartition('_')
+        if not name or mode == colour_mode or mode not in COLOUR_MODES:
+            return
+        self.img_fn = f'{name}_{colour_mode}{ext}'
+        self.img = image(self.img_fn, self.img_size)
+        self.configure(image=self.img)
+
 
 class CustomTreeView(ttk.Treeview):
     """
@@ -28,8 +48,12 @@ class CustomTreeView(ttk.Treeview):
         handling data.
     """
     # Data displayed in the tree
-    data: list[list, list] = []
-    filtered_data: list[list, list]
+    _data: list[list, list] | TokenTable | EntityGroups
+    # Appended tables not yet merged into _data, with their offsets
+    _pending: list[TokenTable]
+    _starts: list[int]
+    # Indexes of the unfiltered rows that pass the filter
+    view: list[int] | np.ndarray
     # Filters
     hidden_ents: list = []
     hidden_pos: list = []
@@ -45,6 +69,13 @@ class CustomTreeView(ttk.Treeview):
         )
         log.debug(f'Constructing treeview widget: {self}')
         self.root = self.nametowidget('')
+        self._data = []
+        self._pending = []
+        self._starts = []
+        self._items = []
+        self._detached = set()
+        self._parities = {}
+        self.view = []
         # Configure treeview
         self.after(10, self._setup_tag_colours)
         self._set_headings(headings, anchor)
@@ -62,11 +93,15 @@ class CustomTreeView(ttk.Treeview):
         self.tk.call(self, 'tag', 'remove', 'highlight')
         self.tk.call(self, 'tag', 'add', 'highlight', item)
 
+    def recolour(self, colour_mode:str):
+        self._setup_tag_colours()
+
     def _setup_tag_colours(self):
         bg = self.root.style.colours[
             self.root.notebook.settings_tab.colour_mode.get()
         ]['background']
         self.tag_configure('highlight', background=bg['secondary'])
+        self.tag_configure('match', background=bg['accent_1'])
 
     def _build_scrollbar(self):
         """Build scrollbar for treeview"""
@@ -88,45 +123,77 @@ class CustomTreeView(ttk.Treeview):
             self.column(heading, anchor=anchor, width=100)
             self.heading(heading, text=heading.title())
 
-    def update_tree(self, data:list[list, list]) -> None:
+    @property
+    def data(self) -> list[list, list] | TokenTable:
+        """Unfiltered data, including any appended tables"""
+        if self._pending:
+            self._data = TokenTable.concat([self._data, *self._pending])
+            self._pending = []
+            self._starts = []
+        return self._data
+
+    def update_tree(self, data:list[list, list] | TokenTable) -> None:
         """Update the values in this treeview widget"""
-        current_data = self.get_children()
-        self.data = data  # unfiltered data
-        self.filtered_data = self.filter(data)
-        # If the data is identical to the previous data, don't bother
-        # updating the widget with the new data.
-        if self.filtered_data == list(current_data):
-            log.debug(
-                f'Cancelled update for {self} because the new data ' \
-                'is identical to the current data.'
-            )
-            return  # cancel the rest of the method
         log.debug(f'Updating {self} contents')
-        # Replace current data with new data
-        self.delete(*current_data)
-        i = 0
-        for i, row in enumerate(self.filtered_data):
-            tag = parity(i)
-            self.insert('', 'end', values=row, tags=(tag,))
-            self.tag_bind(i, '<Motion>', self._set_hover_effect)
-        log.debug(f'Completed update for {self}, item count: {i}')
-
-    def filter(self, data:list[list, list]) -> list[str]:
-        """Returns filtered copy of the entered list"""
-        # Get list of items to filter out
-        hidden = up_list(
-            self.hidden_ents.copy() + self.hidden_pos.copy()
-        )
-        # Create new list without filtered items
-        filtered = [
-            row for row in data \
-            if not any(item in hidden for item in row)
+        self._data = data  # unfiltered data
+        self._pending = []
+        self._starts = []
+        # Detached items are not children so track every item
+        self.delete(*self._items)
+        self._items = [
+            self.insert('', 'end', values=row) for row in data
         ]
+        self._detached = set()
+        self._parities = {}
+        self._apply_filter()
+        log.debug(
+            f'Completed update for {self}, item count: {len(self._items)}'
+        )
+
+    def _apply_filter(self):
+        """Detach hidden items and reattach items that are visible again"""
+        view = self._filter_indexes(self.data)
+        hidden = set(range(len(self._items))).difference(view)
+        for i in hidden - self._detached:
+            self.detach(self._items[i])
+        for position, i in enumerate(view):
+            item = self._items[i]
+            if i in self._detached:
+                self.move(item, '', position)
+            tag = parity(position)
+            if self._parities.get(i) != tag:
+                self.item(item, tags=(tag,))
+                self._parities[i] = tag
         log.debug(
-            f'Filtered data for {self}, before:[{len(data)}] '  \
-            f'after:[{len(filtered)}]'
+            f'Filtered {self}, detached {len(hidden - self._detached)} ' \
+            f'reattached {len(self._detached - hidden)}'
         )
-        return filtered
+        self._detached = hidden
+        self.view = view
+
+    def _filter_indexes(self, data:list[list, list] | TokenTable) -> list:
+        """Returns the indexes of the rows that pass the filter"""
+        if isinstance(data, TABLES):
+            return data.visible(self.hidden_ents, self.hidden_pos)
+        hidden = set(up_list(self.hidden_ents + self.hidden_pos))
+        # Only label columns are filtered, never the word itself
+        return [
+            i for i, row in enumerate(data) \
+            if hidden.isdisjoint(row[1:])
+        ]
+
+    def filter(self, data:list[list, list] | TokenTable) -> list[list]:
+        """Returns filtered copy of the entered list"""
+        indexes = self._filter_indexes(data)
+        if isinstance(data, TABLES):
+            return list(data.rows(indexes))
+        return [data[i] for i in indexes]
+
+    def visible_rows(self):
+        """Yields the filtered rows without touching the widget"""
+        data = self.data
+        for i in self.view:
+            yield data.row(i) if isinstance(data, TABLES) else data[i]
 
     def set_filter(
         self, hidden_ents:list, hidden_pos:list, update:bool
@@ -136,7 +203,262 @@ class CustomTreeView(ttk.Treeview):
         self.hidden_pos = hidden_pos
         log.debug(f'Set filters for {self}')
         if update:
-            self.update_tree(data=self.data)
+            self._apply_filter()
+
+
+class VirtualTreeView(CustomTreeView):
+    """
+        Treeview over a TokenTable that only materializes the rows in
+        the viewport. A small pool of items is recycled while scrolling
+        so the widget cost does not grow with the size of the table.
+    """
+    # Index into view of the top row in the viewport
+    top: int = 0
+
+    def __init__(
+        self, master:tk.Widget, headings:tuple[str],
+        anchor:str='w', style:str='Treeview', buffer:int=3, **kw
+    ):
+        super().__init__(master, headings, anchor, style, **kw)
+        self.buffer = buffer
+        self.view = np.zeros(0, dtype=np.intp)
+        # Streamed rows extend the view in place while this has room
+        self._view_buffer = self.view
+        self._length = 0
+        self._pool = []
+        self._shown = []
+        self._selected = None
+        # Rows that match the search bar query
+        self.matches = set()
+        self._row_height = 20
+        self._header_height = 25
+        # The scrollbar follows the model instead of the widget
+        self.scrollbar.configure(command=self._on_scrollbar)
+        self.configure(yscrollcommand='')
+        self.bind('<Configure>', self._on_resize, add=True)
+        self.bind('<MouseWheel>', self._on_mousewheel)
+        self.bind('<Button-4>', lambda e: self.scroll(-3))
+        self.bind('<Button-5>', lambda e: self.scroll(3))
+        self.bind('<Prior>', lambda e: self.scroll(-self._visible_rows()))
+        self.bind('<Next>', lambda e: self.scroll(self._visible_rows()))
+        self.bind('<Up>', self._on_arrow_key)
+        self.bind('<Down>', self._on_arrow_key)
+        self.bind('<<TreeviewSelect>>', self._on_select, add=True)
+
+    def _visible_rows(self) -> int:
+        height = self.winfo_height() - self._header_height
+        return max(1, height // self._row_height)
+
+    def _measure_rows(self):
+        """Measure row and heading heights from a rendered item"""
+        if not self._pool:
+            return
+        bbox = self.bbox(self._pool[0])
+        if bbox:
+            self._header_height, self._row_height = bbox[1], bbox[3]
+
+    def _resize_pool(self):
+        size = self._visible_rows() + self.buffer
+        while len(self._pool) < size:
+            item = self.insert('', 'end')
+            # Items are only attached while they show a row
+            self.detach(item)
+            self._pool.append(item)
+            self._shown.append(None)
+        while len(self._pool) > size:
+            self.delete(self._pool.pop())
+            self._shown.pop()
+
+    def _on_resize(self, event=None):
+        self._measure_rows()
+        self._resize_pool()
+        self.refresh()
+
+    def _on_mousewheel(self, event):
+        self.scroll(int(-1 * (event.delta / 120)) * 3)
+        return 'break'
+
+    def _on_arrow_key(self, event):
+        focus = self.focus()
+        if focus not in self._pool:
+            return
+        position = self._pool.index(focus)
+        step = -1 if event.keysym == 'Up' else 1
+        if 0 <= position + step < self._visible_rows():
+            return  # the default binding can move within the viewport
+        self.scroll(step)
+        return 'break'
+
+    @property
+    def selected_row(self) -> int | None:
+        """Unfiltered index of the selected row"""
+        return self._selected
+
+    def _on_select(self, event=None):
+        selection = self.selection()
+        if selection and selection[0] in self._pool:
+            position = self._pool.index(selection[0])
+            self._selected = self._shown[position]
+
+    def _on_scrollbar(self, action:str, amount:str, unit:str=None):
+        if action == 'moveto':
+            self.scroll_to(int(float(amount) * len(self.view)))
+            return
+        step = int(amount)
+        if unit == 'pages':
+            step *= self._visible_rows()
+        self.scroll(step)
+
+    def scroll(self, rows:int):
+        """Scroll the viewport by a number of rows"""
+        self.scroll_to(self.top + rows)
+
+    def scroll_to(self, position:int):
+        """Scroll so that view[position] is the top row"""
+        last = max(0, len(self.view) - self._visible_rows())
+        top = min(max(0, position), last)
+        if top == self.top:
+            return
+        self.top = top
+        self.refresh()
+
+    def see_row(self, index:int):
+        """Scroll an unfiltered row index into view if it is visible"""
+        position = np.searchsorted(self.view, index)
+        if position < len(self.view) and self.view[position] == index:
+            self.scroll_to(int(position) - self._visible_rows() // 2)
+
+    def select_row(self, index:int):
+        """Select an unfiltered row index and scroll it into view"""
+        self._selected = index
+        self.see_row(index)
+        self.refresh()
+
+    def set_matches(self, rows:Iterable[int]):
+        """Highlight the rows that match a search"""
+        self.matches = set(rows)
+        self._redraw()
+        self.refresh()
+
+    def _redraw(self):
+        """Rewrite every shown pool item on the next refresh"""
+        self._shown = [
+            None if index is None else -1 for index in self._shown
+        ]
+
+    def _row(self, index:int) -> list:
+        """
+            Returns an unfiltered row without merging appended tables,
+            so streaming stays linear in the number of rows.
+        """
+        if not self._pending or index < len(self._data):
+            return self._data.row(index)
+        chunk = bisect_right(self._starts, index) - 1
+        return self._pending[chunk].row(index - self._starts[chunk])
+
+    def refresh(self):
+        """Recycle the item pool to show the rows in the viewport"""
+        selection = ()
+        for position, item in enumerate(self._pool):
+            i = self.top + position
+            if i >= len(self.view):
+                if self._shown[position] is not None:
+                    self.detach(item)
+                    self._shown[position] = None
+                continue
+            index = self.view[i]
+            if self._shown[position] is None:
+                self.move(item, '', position)
+            if self._shown[position] != index:
+                tags = (parity(i), 'match') if index in self.matches \
+                    else (parity(i),)
+                self.item(item, values=self._row(index), tags=tags)
+                self._shown[position] = index
+            if index == self._selected:
+                selection = (item,)
+        if self.selection() != selection:
+            self.selection_set(selection)
+        self.yview_moveto(0)
+        total = len(self.view)
+        if total:
+            first = self.top / total
+            last = (self.top + self._visible_rows()) / total
+            self.scrollbar.set(first, min(1, last))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def update_tree(self, data:TokenTable | EntityGroups) -> None:
+        """Replace the model shown by this treeview"""
+        if not isinstance(data, TABLES):
+            data = TokenTable.empty()
+        self._data = data
+        self._pending = []
+        self._starts = []
+        self._length = len(data)
+        self.view = self._filter_indexes(data)
+        self.top = 0
+        self._selected = None
+        self.matches = set()
+        self._shown = [None] * len(self._pool)
+        for item in self._pool:
+            self.detach(item)
+        self._resize_pool()
+        self.refresh()
+        log.debug(
+            f'Updated {self} model, rows: {self._length} ' \
+            f'visible: {len(self.view)}'
+        )
+
+    def append_rows(self, rows:TokenTable) -> None:
+        """Append a table to the model and refresh if it is in view"""
+        self._pending.append(rows)
+        self._starts.append(self._length)
+        self._extend_view(self._filter_indexes(rows) + self._length)
+        self._length += len(rows)
+        if self.top + len(self._pool) > len(self.view) - len(rows):
+            self.refresh()
+
+    def _extend_view(self, indexes:np.ndarray):
+        """
+            Append to the view, doubling its buffer when it is full so
+            appending chunk after chunk doesn't copy the view each time.
+        """
+        size = len(self.view) + len(indexes)
+        if self.view.base is not self._view_buffer \
+                or size > len(self._view_buffer):
+            buffer = np.empty(max(size, 2 * len(self.view)), dtype=np.intp)
+            buffer[:len(self.view)] = self.view
+            self._view_buffer = buffer
+        self._view_buffer[len(self.view):size] = indexes
+        self.view = self._view_buffer[:size]
+
+    def model_changed(self) -> None:
+        """
+            Refresh after rows of the model were changed in place, such
+            as the counts of grouped entities. Every pool item is
+            rewritten since its row index alone no longer shows whether
+            its values are current.
+        """
+        self._length = len(self.data)
+        self._redraw()
+        self._apply_filter()
+
+    def visible_rows(self):
+        """Yields the filtered rows without touching the widget"""
+        return self.data.rows(self.view)
+
+    def _apply_filter(self):
+        """
+            Swap in the filtered view from the label indexes and keep
+            the current top row in place. Only pool items whose row
+            changed are touched.
+        """
+        anchor = self.view[self.top] if self.top < len(self.view) else 0
+        self.view = self._filter_indexes(self.data)
+        last = max(0, len(self.view) - self._visible_rows())
+        self.top = min(int(np.searchsorted(self.view, anchor)), last)
+        self.refresh()
+        log.debug(f'Filtered {self}, visible: {len(self.view)}')
 
 
 class SettingWidget(ttk.Frame):
@@ -161,6 +483,9 @@ class SettingWidget(ttk.Frame):
         cfg = self.master.master.master.master.master.master.cfg  # this is just bad
         try:
             cfg.update('settings', self.var)
+        except tk.TclError:
+            # The entry holds a value its variable can't store yet
+            log.debug(f'Ignored invalid value for {self.var}')
         except AttributeError:
             print('failed update attribute error')
             # TODO: logging
@@ -0,0 +1,191 @@
+import time
+import json
+import sqlite3
+import hashlib
+import logging
+import numpy as np
+from threading import local, Lock
+
+from results import TokenTable
+
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    source TEXT NOT NULL,
+    title TEXT,
+    content_hash TEXT NOT NULL,
+    pipeline TEXT NOT NULL,
+    fetch_s REAL,
+    parse_s REAL,
+    token_count INTEGER NOT NULL,
+    -- Run whose rows hold the tokens, runs of identical content parsed
+    -- by the same pipeline share them
+    tokens_run INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    -- JSON list of paragraph start offsets in text
+    paragraphs TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_content ON runs(content_hash, pipeline);
+CREATE INDEX IF NOT EXISTS runs_started ON runs(started);
+CREATE TABLE IF NOT EXISTS tokens (
+    run_id INTEGER NOT NULL,
+    i INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    word TEXT NOT NULL,
+    lower INTEGER NOT NULL,
+    ent TEXT NOT NULL,
+    iob INTEGER NOT NULL,
+    pos TEXT NOT NULL,
+    PRIMARY KEY (run_id, i)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tokens_ent ON tokens(ent, run_id);
+CREATE INDEX IF NOT EXISTS tokens_pos ON tokens(pos, run_id);
+CREATE INDEX IF NOT EXISTS tokens_word ON tokens(word COLLATE NOCASE, run_id);
+"""
+
+
+def content_hash(text:str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class History:
+    """
+        SQLite store of every processed document and its token rows.
+        The database runs in WAL mode so the history can be browsed
+        while a run is being written, and each thread uses its own
+        connection.
+    """
+    def __init__(self, path:str):
+        self.path = path
+        self._local = local()
+        self._write_lock = Lock()
+        with self._connection() as db:
+            db.executescript(SCHEMA)
+            columns = {
+                row[1] for row in db.execute('PRAGMA table_info(runs)')
+            }
+            if 'paragraphs' not in columns:
+                # Added after the first release of the history
+                db.execute('ALTER TABLE runs ADD COLUMN paragraphs TEXT')
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def record(
+            self, source:str, title:str, text:str, pipeline:str,
+            table:TokenTable, fetch_s:float=None, parse_s:float=None
+        ) -> int:
+        """Store a run and its tokens, returns the id of the run"""
+        digest = content_hash(text)
+        paragraphs = None if table.paragraphs is None \
+            else json.dumps(table.paragraphs.tolist())
+        db = self._connection()
+        with self._write_lock, db:
+            owner = db.execute(
+                'SELECT tokens_run FROM runs '
+                'WHERE content_hash = ? AND pipeline = ? LIMIT 1',
+                (digest, pipeline)
+            ).fetchone()
+            cursor = db.execute(
+                'INSERT INTO runs (started, source, title, content_hash, '
+                'pipeline, fetch_s, parse_s, token_count, tokens_run, text, '
+                'paragraphs) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    time.time(), source, title, digest, pipeline, fetch_s,
+                    parse_s, len(table), owner[0] if owner else 0, text,
+                    paragraphs
+                )
+            )
+            run_id = cursor.lastrowid
+            if owner:
+                log.debug(f'Run {run_id} shares tokens with run {owner[0]}')
+                return run_id
+            db.execute(
+                'UPDATE runs SET tokens_run = ? WHERE id = ?',
+                (run_id, run_id)
+            )
+            db.executemany(
+                'INSERT INTO tokens (run_id, i, idx, length, word, lower, '
+                'ent, iob, pos) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                self._token_rows(run_id, table)
+            )
+        log.info(f'Recorded run {run_id} of {source}, {len(table)} tokens')
+        return run_id
+
+    def _token_rows(self, run_id:int, table:TokenTable):
+        ents = np.array(table.ent_labels, dtype=object)[table.ent]
+        pos = np.array(table.pos_labels, dtype=object)[table.pos]
+        # sqlite integers are signed, hashes are stored bit for bit
+        lower = table.lower.view(np.int64)
+        text = table.text
+        return zip(
+            [run_id] * len(table), range(len(table)),
+            table.idx.tolist(), table.length.tolist(),
+            (text[start:start + size] for start, size in zip(
+                table.idx.tolist(), table.length.tolist()
+            )),
+            lower.tolist(), ents.tolist(), table.iob.tolist(), pos.tolist()
+        )
+
+    def runs(self, limit:int=500, matching:str='') -> list[tuple]:
+        """
+            Returns (id, started, title, source, tokens, pipeline) of
+            the latest runs. If matching is given only runs with a word,
+            entity type or part of speech equal to it are returned.
+        """
+        query = (
+            'SELECT id, started, title, source, token_count, pipeline '
+            'FROM runs'
+        )
+        args = ()
+        if matching:
+            query += (
+                ' WHERE tokens_run IN ('
+                'SELECT run_id FROM tokens WHERE word = ? COLLATE NOCASE '
+                'UNION SELECT run_id FROM tokens WHERE ent = ? '
+                'UNION SELECT run_id FROM tokens WHERE pos = ?)'
+            )
+            args = (matching, matching.upper(), matching.upper())
+        query += ' ORDER BY started DESC LIMIT ?'
+        return self._connection().execute(query, (*args, limit)).fetchall()
+
+    def load(self, run_id:int) -> tuple[str, str, TokenTable]:
+        """Returns the title, text and token table of a run"""
+        db = self._connection()
+        title, text, tokens_run, paragraphs = db.execute(
+            'SELECT title, text, tokens_run, paragraphs FROM runs '
+            'WHERE id = ?',
+            (run_id,)
+        ).fetchone()
+        if paragraphs is not None:
+            paragraphs = json.loads(paragraphs)
+        rows = db.execute(
+            'SELECT idx, length, ent, iob, pos, lower FROM tokens '
+            'WHERE run_id = ? ORDER BY i',
+            (tokens_run,)
+        ).fetchall()
+        if not rows:
+            return title, text, TokenTable.empty()
+        idx, length, ent, iob, pos, lower = zip(*rows)
+        return title, text, TokenTable.from_columns(
+            text=text, idx=idx, length=length, ent=ent, iob=iob, pos=pos,
+            lower=np.array(lower, dtype=np.int64).view(np.uint64),
+            paragraphs=paragraphs
+        )
+
+    def close(self):
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
@@ -0,0 +1,261 @@
+import logging
+import tkinter as tk
+from enum import Enum
+from queue import Queue, SimpleQueue, Empty
+from threading import Thread, Event, Lock, Timer
+from typing import Callable
+
+from exceptions import JobCancelled
+from constants import DISPATCH_INTERVAL_MS
+
+
+log = logging.getLogger(__name__)
+
+
+class JobState(Enum):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    TIMED_OUT = 'timed out'
+
+
+class Dispatcher:
+    """
+        Thread safe queue of callbacks that are run on the Tk thread.
+        Posting only queues the callback, the Tk thread drains the
+        queue from an after loop it starts itself, so other threads
+        never call into Tk. Callbacks posted before the loop starts
+        wait in the queue.
+    """
+    def __init__(self, root:tk.Tk, interval:int=DISPATCH_INTERVAL_MS):
+        self.root = root
+        self.interval = interval
+        self._queue = SimpleQueue()
+        self._after = None
+
+    def start(self):
+        """Start draining the queue, call this on the Tk thread"""
+        if self._after is None:
+            self._after = self.root.after(self.interval, self._poll)
+
+    def stop(self):
+        """Stop draining, callbacks still queued are dropped"""
+        if self._after is not None:
+            self.root.after_cancel(self._after)
+            self._after = None
+
+    def post(self, func:Callable, *args):
+        """Run func(*args) on the Tk thread"""
+        self._queue.put((func, args))
+
+    def _poll(self):
+        self._drain()
+        self._after = self.root.after(self.interval, self._poll)
+
+    def _drain(self):
+        while True:
+            try:
+                func, args = self._queue.get_nowait()
+            except Empty:
+                return
+            try:
+                func(*args)
+            except Exception:
+                log.exception(f'Dispatched callback {func} failed')
+
+
+class Job:
+    """A unit of work run by the JobScheduler"""
+    def __init__(
+            self, func:Callable, name:str, timeout:float=None,
+            on_done:Callable=None, on_error:Callable=None,
+            on_cancel:Callable=None
+        ):
+        self.func = func
+        self.name = name
+        self.timeout = timeout
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_cancel = on_cancel
+        self.state = JobState.QUEUED
+        self.result = None
+        self.error = None
+        self._cancelled = Event()
+        self._timed_out = False
+        self._timer = None
+        self._lock = Lock()
+        # Set by the scheduler to post callbacks to the Tk thread
+        self._post = lambda callback, *args: None
+
+    def __repr__(self) -> str:
+        return f'<Job {self.name} {self.state.value}>'
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def _stop(self, state:JobState):
+        """
+            Mark the job as abandoned and notify the GUI straight away.
+            The job's thread finishes in the background at its next
+            check and its result is discarded.
+        """
+        with self._lock:
+            if self.cancelled or self.state not in (
+                JobState.QUEUED, JobState.RUNNING
+            ):
+                return
+            self._timed_out = state == JobState.TIMED_OUT
+            self._cancelled.set()
+            self.state = state
+        log.info(f'Job {self.name} {state.value}')
+        self._post(self.on_cancel, self)
+
+    def cancel(self):
+        """Abandon the job, its thread stops at the next check"""
+        self._stop(JobState.CANCELLED)
+
+    def _expire(self):
+        log.warning(f'Job {self.name} timed out after {self.timeout}s')
+        self._stop(JobState.TIMED_OUT)
+
+    def check(self):
+        """Raises JobCancelled if the job has been cancelled"""
+        if self.cancelled:
+            raise JobCancelled(self.name, timed_out=self._timed_out)
+
+
+class JobScheduler:
+    """
+        Runs jobs from a queue on a fixed number of threads. Jobs can
+        be cancelled or time out, and their callbacks are posted to the
+        Tk thread through the dispatcher.
+    """
+    def __init__(self, dispatcher:Dispatcher, threads:int=1):
+        self.dispatcher = dispatcher
+        self._queue = Queue()
+        self._lock = Lock()
+        # Jobs queued or running, including abandoned jobs whose
+        # thread hasn't stopped yet
+        self._active = 0
+        self._idle_callbacks = []
+        self._closed = False
+        self.threads = []
+        for i in range(threads):
+            thread = Thread(
+                target=self._worker, name=f'job-runner-{i}', daemon=True
+            )
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(
+            self, func:Callable, name:str, timeout:float=None,
+            on_done:Callable=None, on_error:Callable=None,
+            on_cancel:Callable=None
+        ) -> Job:
+        """
+            Queue func(job) to run on a worker thread. Long running
+            functions should call job.check() between steps.
+        """
+        job = Job(func, name, timeout, on_done, on_error, on_cancel)
+        job._post = self._post
+        with self._lock:
+            if self._closed:
+                log.debug(f'Dropped job {job.name}, scheduler is shut down')
+                job.cancel()
+                return job
+            self._active += 1
+        log.debug(f'Queued job {job.name}')
+        self._queue.put(job)
+        return job
+
+    @property
+    def idle(self) -> bool:
+        """True when no jobs are queued or running"""
+        return not self._active
+
+    def when_idle(self, callback:Callable):
+        """Post callback to the Tk thread once no jobs are left"""
+        with self._lock:
+            if self._active:
+                self._idle_callbacks.append(callback)
+                return
+        self._post(callback)
+
+    def shutdown(self):
+        """
+            Stop the threads once their current jobs return. Queued jobs
+            are cancelled and later submissions are dropped.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        log.debug(f'Shutting down {len(self.threads)} job threads')
+        for _ in self.threads:
+            self._queue.put(None)
+
+    def _post(self, callback:Callable, *args):
+        if callback is not None:
+            self.dispatcher.post(callback, *args)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            try:
+                if self._closed:
+                    job.cancel()
+                self._run(job)
+            finally:
+                self._job_finished()
+
+    def _run(self, job:Job):
+        with job._lock:
+            if job.cancelled:
+                return
+            job.state = JobState.RUNNING
+        if job.timeout:
+            job._timer = Timer(job.timeout, job._expire)
+            job._timer.daemon = True
+            job._timer.start()
+        try:
+            result = job.func(job)
+        except JobCancelled:
+            log.debug(f'Job {job.name} stopped after cancellation')
+            return
+        except Exception as e:
+            self._finish(job, JobState.FAILED, job.on_error, e)
+            return
+        finally:
+            if job._timer is not None:
+                job._timer.cancel()
+        self._finish(job, JobState.DONE, job.on_done, result)
+
+    def _job_finished(self):
+        with self._lock:
+            self._active -= 1
+            if self._active:
+                return
+            callbacks, self._idle_callbacks = self._idle_callbacks, []
+        for callback in callbacks:
+            self._post(callback)
+
+    def _finish(
+            self, job:Job, state:JobState, callback:Callable, value
+        ):
+        with job._lock:
+            if job.cancelled:
+                # The job was abandoned, drop whatever it produced
+                return
+            job.state = state
+            if state == JobState.DONE:
+                job.result = value
+            else:
+                job.error = value
+                log.error(f'Job {job.name} failed: {value!r}')
+        log.debug(f'Job {job.name} {state.value}')
+        self._post(callback, value)
@@ -0,0 +1,116 @@
+from __future__ import annotations
+import logging
+from threading import Lock
+from typing import Iterable, TYPE_CHECKING
+
+from constants import COLUMN_COMPONENTS, OPTIONAL_COMPONENTS
+
+if TYPE_CHECKING:
+    from spacy.language import Language
+
+
+log = logging.getLogger(__name__)
+
+
+def required_components(
+        entities:bool=True, pos:bool=True, keep:Iterable[str]=()
+    ) -> set[str]:
+    """Returns the optional components needed for the enabled columns"""
+    required = set(keep)
+    if entities:
+        required.update(COLUMN_COMPONENTS['entities'])
+    if pos:
+        required.update(COLUMN_COMPONENTS['pos'])
+    return required
+
+def excluded_components(
+        entities:bool=True, pos:bool=True, keep:Iterable[str]=()
+    ) -> list[str]:
+    """
+        Returns the components that can be excluded from the pipeline
+        because none of the enabled columns read their output.
+    """
+    required = required_components(entities, pos, keep)
+    return [name for name in OPTIONAL_COMPONENTS if name not in required]
+
+def settings_components(settings) -> dict[str, list[str]]:
+    """Returns load arguments derived from the settings section"""
+    keep = [
+        name.strip() for name in settings['keep_components'].split(',')
+        if name.strip()
+    ]
+    disable = [
+        name.strip() for name in settings['disable_components'].split(',')
+        if name.strip()
+    ]
+    exclude = excluded_components(
+        entities=settings.getboolean('entity_column'),
+        pos=settings.getboolean('pos_column'),
+        keep=keep + disable
+    )
+    return {'exclude': exclude, 'disable': disable}
+
+def load_pipeline(
+        name:str, exclude:Iterable[str]=(), disable:Iterable[str]=()
+    ) -> Language:
+    """
+        Load a spacy pipeline. Excluded components are never loaded,
+        disabled components are loaded but do not run until enabled.
+    """
+    from spacy import load as get_pipe
+    log.debug(
+        f'Loading {name}, exclude={list(exclude)} disable={list(disable)}'
+    )
+    pipeline = get_pipe(name, exclude=list(exclude), disable=list(disable))
+    log.info(f'Loaded {name} with components {pipeline.pipe_names}')
+    return pipeline
+
+
+class PipelineHolder:
+    """
+        Process level holder for the loaded pipeline. The pipeline is
+        kept alive across app restarts and only reloaded when the name
+        or components it was loaded with change.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._key = None
+        self._pipeline = None
+
+    def get(
+            self, name:str, exclude:Iterable[str]=(),
+            disable:Iterable[str]=()
+        ) -> Language:
+        """Returns the pipeline, loading it if the settings changed"""
+        key = (name, tuple(sorted(exclude)), tuple(sorted(disable)))
+        with self._lock:
+            if key == self._key:
+                log.info(f'Reusing loaded pipeline {name}')
+                return self._pipeline
+            # Release the old pipeline before loading the new one
+            self._pipeline = None
+            self._pipeline = load_pipeline(name, exclude, disable)
+            self._key = key
+            return self._pipeline
+
+    def swap(
+            self, name:str, exclude:Iterable[str]=(),
+            disable:Iterable[str]=()
+        ) -> Language:
+        """
+            Like get, but the current pipeline is kept until the new one
+            has loaded so it can stay in service meanwhile.
+        """
+        key = (name, tuple(sorted(exclude)), tuple(sorted(disable)))
+        with self._lock:
+            if key == self._key:
+                log.info(f'Reusing loaded pipeline {name}')
+                return self._pipeline
+        pipeline = load_pipeline(name, exclude, disable)
+        with self._lock:
+            self._pipeline = pipeline
+            self._key = key
+        return pipeline
+
+
+pipelines = PipelineHolder()
@@ -0,0 +1,341 @@
+from __future__ import annotations
+import re
+import logging
+import numpy as np
+from typing import Iterable, Iterator, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from spacy.tokens import Doc
+
+
+log = logging.getLogger(__name__)
+
+# Label shown for tokens without an entity or part of speech
+NO_LABEL = 'N/A'
+# Values of the spacy ENT_IOB attribute
+IOB_INSIDE = 1
+IOB_BEGIN = 3
+_LINE_BREAK = re.compile(r'\n')
+
+
+class TokenTable:
+    """
+        Columnar table of parsed tokens. Words are slices of a single
+        contiguous text buffer given by their offset and length, entity
+        types and parts of speech are stored as small integer codes
+        over label tables shared by every row. The iob column marks
+        where each entity span begins so spans can be rebuilt, and the
+        lower column holds the hash of each lowercased word so words
+        can be counted without building strings. paragraphs holds the
+        start offset of each paragraph of the text when it is known.
+    """
+    __slots__ = (
+        'text', 'idx', 'length', 'ent', 'iob', 'pos', 'lower',
+        'ent_labels', 'pos_labels', 'paragraphs', '_indexes'
+    )
+
+    def __init__(
+            self, text:str, idx:np.ndarray, length:np.ndarray,
+            ent:np.ndarray, iob:np.ndarray, pos:np.ndarray,
+            lower:np.ndarray, ent_labels:tuple[str], pos_labels:tuple[str],
+            paragraphs:np.ndarray=None
+        ):
+        self.text = text
+        self.idx = idx
+        self.length = length
+        self.ent = ent
+        self.iob = iob
+        self.pos = pos
+        self.lower = lower
+        self.ent_labels = ent_labels
+        self.pos_labels = pos_labels
+        self.paragraphs = paragraphs
+        self._indexes = {}
+
+    @classmethod
+    def from_doc(cls, doc:Doc) -> 'TokenTable':
+        """Extracts the token attributes of a doc in bulk"""
+        from spacy.attrs import ENT_TYPE, ENT_IOB, POS, IDX, LENGTH, LOWER
+        array = doc.to_array([ENT_TYPE, POS, IDX, LENGTH, ENT_IOB, LOWER])
+        ent, ent_labels = _encode(array[:, 0], doc)
+        pos, pos_labels = _encode(array[:, 1], doc)
+        return cls(
+            text=doc.text,
+            idx=array[:, 2].astype(np.int32),
+            length=array[:, 3].astype(np.int32),
+            ent=ent, iob=array[:, 4].astype(np.uint8), pos=pos,
+            lower=array[:, 5],
+            ent_labels=ent_labels, pos_labels=pos_labels
+        )
+
+    @classmethod
+    def from_columns(
+            cls, text:str, idx:Iterable[int], length:Iterable[int],
+            ent:Iterable[str], iob:Iterable[int], pos:Iterable[str],
+            lower:np.ndarray, paragraphs:Iterable[int]=None
+        ) -> 'TokenTable':
+        """Builds a table from stored columns without spacy"""
+        ent_labels, ent = np.unique(np.array(ent), return_inverse=True)
+        pos_labels, pos = np.unique(np.array(pos), return_inverse=True)
+        return cls(
+            text=text,
+            idx=np.array(idx, dtype=np.int32),
+            length=np.array(length, dtype=np.int32),
+            ent=ent.astype(np.uint8), iob=np.array(iob, dtype=np.uint8),
+            pos=pos.astype(np.uint8), lower=lower,
+            ent_labels=tuple(ent_labels.tolist()),
+            pos_labels=tuple(pos_labels.tolist()),
+            paragraphs=None if paragraphs is None
+                else np.array(paragraphs, dtype=np.int64)
+        )
+
+    @classmethod
+    def empty(cls) -> 'TokenTable':
+        codes = np.zeros(0, dtype=np.uint8)
+        offsets = np.zeros(0, dtype=np.int32)
+        hashes = np.zeros(0, dtype=np.uint64)
+        return cls('', offsets, offsets, codes, codes, codes, hashes, (), ())
+
+    @classmethod
+    def concat(cls, tables:Iterable['TokenTable']) -> 'TokenTable':
+        """
+            Joins tables end to end. Character offsets are shifted so
+            they point into the joined text.
+        """
+        tables = list(tables)
+        if not tables:
+            return cls.empty()
+        if len(tables) == 1:
+            return tables[0]
+        ent_labels = _union(table.ent_labels for table in tables)
+        pos_labels = _union(table.pos_labels for table in tables)
+        shifts = np.cumsum([0] + [len(table.text) for table in tables])
+        paragraphs = None
+        if any(table.paragraphs is not None for table in tables):
+            paragraphs = np.concatenate([
+                table.paragraph_starts() + shift
+                for table, shift in zip(tables, shifts)
+            ])
+        return cls(
+            text=''.join(table.text for table in tables),
+            idx=np.concatenate([
+                table.idx + shift for table, shift in zip(tables, shifts)
+            ]),
+            length=np.concatenate([table.length for table in tables]),
+            ent=np.concatenate([
+                _recode(table.ent, table.ent_labels, ent_labels)
+                for table in tables
+            ]),
+            iob=np.concatenate([table.iob for table in tables]),
+            pos=np.concatenate([
+                _recode(table.pos, table.pos_labels, pos_labels)
+                for table in tables
+            ]),
+            lower=np.concatenate([table.lower for table in tables]),
+            ent_labels=ent_labels, pos_labels=pos_labels,
+            paragraphs=paragraphs
+        )
+
+    def with_paragraphs(self, starts:Iterable[int]) -> 'TokenTable':
+        """Returns the table with the given paragraph start offsets"""
+        return TokenTable(
+            self.text, self.idx, self.length, self.ent, self.iob, self.pos,
+            self.lower, self.ent_labels, self.pos_labels,
+            paragraphs=np.array(starts, dtype=np.int64)
+        )
+
+    def paragraph_starts(self) -> np.ndarray:
+        """
+            Returns the start offset of each paragraph. Without known
+            paragraphs the text is split at its line breaks.
+        """
+        if self.paragraphs is not None:
+            return self.paragraphs
+        return np.array([0] + [
+            match.end() for match in _LINE_BREAK.finditer(self.text)
+            if match.end() < len(self.text)
+        ], dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.idx)
+
+    def __iter__(self) -> Iterator[list[str]]:
+        return self.rows()
+
+    def word(self, i:int) -> str:
+        start = self.idx[i]
+        return self.text[start:start + self.length[i]]
+
+    def row(self, i:int) -> list[str]:
+        """Returns a single row as [word, entity, pos]"""
+        return [
+            self.word(i),
+            self.ent_labels[self.ent[i]],
+            self.pos_labels[self.pos[i]]
+        ]
+
+    def rows(self, indices:Iterable[int]=None) -> Iterator[list[str]]:
+        """Yields [word, entity, pos] rows, optionally only some"""
+        if indices is None:
+            indices = range(len(self))
+        for i in indices:
+            yield self.row(i)
+
+    def tolist(self) -> list[list[str]]:
+        return list(self.rows())
+
+    def spans(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+            Returns the start offset, end offset and label code of every
+            entity span, as given by the doc's ents.
+        """
+        starts = np.flatnonzero(self.iob == IOB_BEGIN)
+        # A span ends at the first token after its start that doesn't
+        # continue it.
+        breaks = np.append(np.flatnonzero(self.iob != IOB_INSIDE), len(self))
+        ends = breaks[np.searchsorted(breaks, starts, side='right')] - 1
+        return (
+            self.idx[starts], self.idx[ends] + self.length[ends],
+            self.ent[starts]
+        )
+
+    def codes(self, labels:Iterable[str], column:str) -> list[int]:
+        """Returns the codes of the labels used in a column"""
+        table = self.ent_labels if column == 'ent' else self.pos_labels
+        labels = {label.upper() for label in labels}
+        return [code for code, label in enumerate(table) if label in labels]
+
+    def index(self, column:str) -> list[np.ndarray]:
+        """
+            Returns the sorted row indexes of every label code in a
+            column. The index is built once per table.
+        """
+        index = self._indexes.get(column)
+        if index is not None:
+            return index
+        codes, labels = (self.ent, self.ent_labels) if column == 'ent' \
+            else (self.pos, self.pos_labels)
+        order = np.argsort(codes, kind='stable')
+        counts = np.bincount(codes, minlength=len(labels))
+        index = np.split(order, np.cumsum(counts)[:-1])
+        self._indexes[column] = index
+        return index
+
+    def mask(
+            self, hidden_ents:Iterable[str], hidden_pos:Iterable[str]
+        ) -> np.ndarray:
+        """Returns a boolean array that is True for visible rows"""
+        mask = np.ones(len(self), dtype=bool)
+        hidden = [
+            self.index(column)[code]
+            for column, labels in (('ent', hidden_ents), ('pos', hidden_pos))
+            for code in self.codes(labels, column)
+        ]
+        if hidden:
+            mask[np.concatenate(hidden)] = False
+        return mask
+
+    def visible(
+            self, hidden_ents:Iterable[str], hidden_pos:Iterable[str]
+        ) -> np.ndarray:
+        """Returns the indexes of the rows that pass the filter"""
+        if not hidden_ents and not hidden_pos:
+            return np.arange(len(self))
+        return np.flatnonzero(self.mask(hidden_ents, hidden_pos))
+
+
+class EntityGroups:
+    """
+        One row per distinct entity text and label with the number of
+        times it occurs and the offset of its first occurrence. Tables
+        can be added as they are parsed, the groups are updated in a
+        single pass over their entity spans.
+    """
+    def __init__(self):
+        self.texts = []
+        self.labels = []
+        self.counts = []
+        self.first = []
+        self._rows = {}
+        # Length of the text added so far, offsets are shifted by it
+        self._offset = 0
+
+    @classmethod
+    def from_table(cls, table:TokenTable) -> 'EntityGroups':
+        groups = cls()
+        groups.add(table)
+        return groups
+
+    def add(self, table:TokenTable):
+        """Count the entity spans of a table that follows the last"""
+        starts, ends, codes = table.spans()
+        for start, end, code in zip(
+            starts.tolist(), ends.tolist(), codes.tolist()
+        ):
+            key = (table.text[start:end], table.ent_labels[code])
+            row = self._rows.get(key)
+            if row is not None:
+                self.counts[row] += 1
+                continue
+            self._rows[key] = len(self.texts)
+            self.texts.append(key[0])
+            self.labels.append(key[1])
+            self.counts.append(1)
+            self.first.append(start + self._offset)
+        self._offset += len(table.text)
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __iter__(self) -> Iterator[list]:
+        return self.rows()
+
+    def row(self, i:int) -> list:
+        """Returns a single row as [text, entity, count, first offset]"""
+        return [self.texts[i], self.labels[i], self.counts[i], self.first[i]]
+
+    def rows(self, indices:Iterable[int]=None) -> Iterator[list]:
+        if indices is None:
+            indices = range(len(self))
+        for i in indices:
+            yield self.row(i)
+
+    def tolist(self) -> list[list]:
+        return list(self.rows())
+
+    def visible(
+            self, hidden_ents:Iterable[str], hidden_pos:Iterable[str]=()
+        ) -> np.ndarray:
+        """Returns the indexes of the groups whose entity isn't hidden"""
+        hidden = {label.upper() for label in hidden_ents}
+        return np.array(
+            [i for i, label in enumerate(self.labels) if label not in hidden],
+            dtype=np.intp
+        )
+
+
+def _encode(hashes:np.ndarray, doc:Doc) -> tuple[np.ndarray, tuple]:
+    """Returns label hashes as codes and the label table they index"""
+    unique, codes = np.unique(hashes, return_inverse=True)
+    labels = tuple(
+        doc.vocab.strings[int(value)] if value else NO_LABEL
+        for value in unique
+    )
+    return codes.astype(np.uint8), labels
+
+def _union(label_tables:Iterable[tuple[str]]) -> tuple[str]:
+    labels = {}
+    for table in label_tables:
+        labels.update(dict.fromkeys(table))
+    return tuple(labels)
+
+def _recode(
+        codes:np.ndarray, labels:tuple[str], new_labels:tuple[str]
+    ) -> np.ndarray:
+    """Translates codes from one label table to another"""
+    lookup = np.array(
+        [new_labels.index(label) for label in labels], dtype=np.uint8
+    )
+    if not len(lookup):
+        return codes
+    return lookup[codes]
@@ -0,0 +1,114 @@
+import logging
+import numpy as np
+from bisect import bisect_left, bisect_right
+
+from results import TokenTable
+
+
+log = logging.getLogger(__name__)
+
+# Segments are merged once there are more than this many
+MAX_SEGMENTS = 16
+# Sorts after every character so term + _LAST bounds a prefix range
+_LAST = '\U0010ffff'
+
+
+class InvertedIndex:
+    """
+        Lowercased term to token row index over the parsed tables. Each
+        added table becomes a segment of sorted terms and their rows,
+        so prefix lookups are a bisect per segment. Tables are indexed
+        on the first lookup after they are added and segments are
+        merged when there are too many.
+    """
+    def __init__(self):
+        self._segments = []
+        self._pending = []
+        self._rows = 0
+
+    def add(self, table:TokenTable):
+        """Index a table whose rows follow those already added"""
+        self._pending.append((table, self._rows))
+        self._rows += len(table)
+
+    def clear(self):
+        self._segments = []
+        self._pending = []
+        self._rows = 0
+
+    def _flush(self):
+        for table, offset in self._pending:
+            if len(table):
+                self._segments.append(_segment(table, offset))
+        self._pending = []
+        if len(self._segments) > MAX_SEGMENTS:
+            self._merge()
+
+    def _merge(self):
+        merged = {}
+        # Segments are in row order so merged rows stay sorted
+        for terms, postings in self._segments:
+            for term, rows in zip(terms, postings):
+                merged.setdefault(term, []).append(rows)
+        terms = sorted(merged)
+        postings = [np.concatenate(merged[term]) for term in terms]
+        self._segments = [(terms, postings)]
+        log.debug(f'Merged search index segments, {len(terms)} terms')
+
+    def lookup(self, term:str, prefix:bool=True) -> np.ndarray:
+        """
+            Returns the sorted rows whose lowercased word equals term,
+            or starts with it when prefix is set.
+        """
+        self._flush()
+        term = term.lower()
+        found = []
+        for terms, postings in self._segments:
+            start = bisect_left(terms, term)
+            end = bisect_left(terms, term + _LAST, start) if prefix \
+                else bisect_right(terms, term, start)
+            found.extend(postings[start:end])
+        if not found:
+            return np.zeros(0, dtype=np.intp)
+        rows = np.concatenate(found)
+        rows.sort()
+        return rows
+
+
+def _segment(
+        table:TokenTable, offset:int
+    ) -> tuple[list[str], list[np.ndarray]]:
+    """
+        Returns the sorted terms of a table and the rows of each. Only
+        one string is built per distinct word, the rows are grouped by
+        sorting the word hashes.
+    """
+    _, first, inverse = np.unique(
+        table.lower, return_index=True, return_inverse=True
+    )
+    order = np.argsort(inverse, kind='stable') + offset
+    counts = np.bincount(inverse, minlength=len(first))
+    postings = np.split(order, np.cumsum(counts)[:-1])
+    terms = [table.word(i).lower() for i in first.tolist()]
+    # Whitespace tokens can't be searched for
+    entries = sorted(
+        ((term, rows) for term, rows in zip(terms, postings) if term.strip()),
+        key=lambda entry: entry[0]
+    )
+    return [term for term, _ in entries], [rows for _, rows in entries]
+
+def find(
+        index:InvertedIndex, table:TokenTable, query:str,
+        prefix:bool=True, case_sensitive:bool=False
+    ) -> np.ndarray:
+    """Returns the rows of table whose word matches the query"""
+    query = query.strip()
+    if not query:
+        return np.zeros(0, dtype=np.intp)
+    rows = index.lookup(query, prefix)
+    if case_sensitive:
+        # Only the matches are checked, not every row
+        matches = str.startswith if prefix else str.__eq__
+        keep = [matches(table.word(i), query) for i in rows.tolist()]
+        rows = rows[np.array(keep, dtype=bool)]
+    return rows
@@ -0,0 +1,119 @@
+import logging
+import numpy as np
+from collections import Counter, defaultdict
+
+from results import TokenTable, NO_LABEL
+
+
+log = logging.getLogger(__name__)
+
+COLUMNS = ('ent', 'pos')
+# Parts of speech that are not counted as words
+NON_WORDS = frozenset(('SPACE', 'PUNCT'))
+
+
+class Statistics:
+    """
+        Label counts, top words per label and per paragraph entity
+        density of parsed tables. Tables are added as they are parsed
+        and every count is taken with numpy over the coded columns, so
+        the cost of an update depends on the number of distinct labels
+        and words rather than on the number of tokens.
+    """
+    def __init__(self):
+        self.tokens = 0
+        self.counts = {column: Counter() for column in COLUMNS}
+        self._words = {column: defaultdict(Counter) for column in COLUMNS}
+        # Lowercased text of each word hash seen so far
+        self._text = {}
+        # Word and entity token counts of each paragraph
+        self._para_words = []
+        self._para_ents = []
+
+    def add(self, table:TokenTable):
+        """Count the tokens of a table that follows the last one added"""
+        if not len(table):
+            return
+        self.tokens += len(table)
+        for column in COLUMNS:
+            self._count_column(table, column)
+        self._count_paragraphs(table)
+
+    def _count_column(self, table:TokenTable, column:str):
+        labels = table.ent_labels if column == 'ent' else table.pos_labels
+        codes = table.ent if column == 'ent' else table.pos
+        counts = np.bincount(codes, minlength=len(labels))
+        index = table.index(column)
+        for code, label in enumerate(labels):
+            if not counts[code]:
+                continue
+            self.counts[column][label] += int(counts[code])
+            if label == NO_LABEL:
+                continue
+            rows = index[code]
+            words, first, amounts = np.unique(
+                table.lower[rows], return_index=True, return_counts=True
+            )
+            counter = self._words[column][label]
+            for word, row, amount in zip(
+                words.tolist(), rows[first].tolist(), amounts.tolist()
+            ):
+                if word not in self._text:
+                    self._text[word] = table.word(row).lower()
+                counter[word] += amount
+
+    def _count_paragraphs(self, table:TokenTable):
+        """
+            Tokens are counted in the paragraphs the table carries, or
+            split at line breaks when it has none. Paragraphs also end
+            at the end of each table, since streamed tables each hold a
+            paragraph of scraped text which has had its line breaks
+            removed.
+        """
+        starts = table.paragraph_starts()
+        paragraph = np.searchsorted(starts, table.idx, side='right') - 1
+        # Tokens before the first paragraph belong to it
+        paragraph = np.maximum(paragraph, 0)
+        size = len(starts)
+        non_words = table.codes(NON_WORDS, 'pos')
+        words = ~np.isin(table.pos, non_words)
+        no_label = table.codes((NO_LABEL,), 'ent')
+        entities = words & ~np.isin(table.ent, no_label)
+        para_words = np.bincount(paragraph[words], minlength=size)
+        para_ents = np.bincount(paragraph[entities], minlength=size)
+        self._para_words.extend(para_words.tolist())
+        self._para_ents.extend(para_ents.tolist())
+
+    def labels(self, column:str) -> list[tuple[str, int, float]]:
+        """Returns (label, count, share) for a column, largest first"""
+        counts = self.counts[column]
+        total = sum(counts.values()) or 1
+        return [
+            (label, count, count / total)
+            for label, count in counts.most_common()
+        ]
+
+    def top_words(self, column:str, label:str, n:int=5) -> list[str]:
+        """Returns the n most common words with this label"""
+        return [
+            self._text[word]
+            for word, _ in self._words[column][label].most_common(n)
+        ]
+
+    @property
+    def paragraphs(self) -> int:
+        return len(self._para_words)
+
+    def density(self, start:int=0) -> list[tuple[int, int, int, float]]:
+        """
+            Returns (paragraph, words, entity words, share) for each
+            paragraph from start on that has any words.
+        """
+        return [
+            (i + 1, words, ents, ents / words)
+            for i, (words, ents) in enumerate(
+                zip(self._para_words[start:], self._para_ents[start:]),
+                start=start
+            )
+            if words
+        ]
@@ -0,0 +1,55 @@
+import bz2
+import json
+
+import spacy
+
+import dump
+from dump import iter_articles, run_dump, CHECKPOINT_FILE
+
+
+PAGE = (
+    '<page><title>{title}</title><ns>0</ns><id>{id}</id>'
+    '<revision><id>9{id}</id><text>{text}</text></revision></page>'
+)
+PAGES = [
+    ('One', 'The first article.'),
+    ('Two', '{{Only a template}}'),
+    ('Three', 'The third article.'),
+    ('Four', 'The fourth article.')
+]
+
+
+def _write_dump(path) -> str:
+    pages = ''.join(
+        PAGE.format(title=title, id=i, text=text)
+        for i, (title, text) in enumerate(PAGES)
+    )
+    with bz2.open(path, 'wt', encoding='utf-8') as file:
+        file.write(f'<mediawiki>{pages}</mediawiki>')
+    return str(path)
+
+
+def test_resume_skips_pages_before_stripping(tmp_path, monkeypatch):
+    path = _write_dump(tmp_path / 'dump.xml.bz2')
+    stripped = []
+    strip_markup = dump.strip_markup
+
+    def counting_strip(wikitext):
+        stripped.append(wikitext)
+        return strip_markup(wikitext)
+
+    monkeypatch.setattr(dump, 'strip_markup', counting_strip)
+    articles = list(iter_articles(path, skip=2))
+    assert [context[1] for _, context in articles] == ['Three', 'Four']
+    assert [context[2] for _, context in articles] == [3, 4]
+    assert len(stripped) == 2
+
+
+def test_checkpoint_counts_pages_read(tmp_path):
+    path = _write_dump(tmp_path / 'dump.xml.bz2')
+    output = tmp_path / 'output'
+    assert run_dump(spacy.blank('en'), path, str(output), shard_size=2) == 3
+    with open(output / CHECKPOINT_FILE, encoding='utf-8') as file:
+        state = json.load(file)
+    assert state['articles'] == 3
+    assert state['pages'] == 4
@@ -0,0 +1,59 @@
+from pathlib import Path
+
+import pytest
+from bs4 import BeautifulSoup
+
+from extract import extract_content, extract_content_soup, CONTENT_ID
+
+
+PAGES = sorted((Path(__file__).parent / 'pages').glob('*.html'))
+
+
+def _soup_content(html:bytes | str) -> tuple[str, list[str]]:
+    """The soup reference limited to the content container"""
+    title, _ = extract_content_soup(html)
+    container = BeautifulSoup(html, 'html.parser').find(id=CONTENT_ID)
+    return title, [p.get_text() for p in container.find_all('p')]
+
+
+@pytest.mark.parametrize('page', PAGES, ids=lambda page: page.name)
+def test_saved_page_matches_soup(page):
+    html = page.read_bytes()
+    assert extract_content(html) == _soup_content(html)
+
+
+@pytest.mark.parametrize('html', [
+    # Stray end tags close nothing
+    '<title>T</title><div id="mw-content-text"><div><p>a</p></span>'
+    '</div><p>b</p></div><p>outside</p>',
+    '<title>T</title><div id="mw-content-text"><p>a</b></p></div>'
+    '</div><p>b</p>',
+    # Unclosed inline tags are closed with their container
+    '<title>T</title><div id="mw-content-text"><p><i>a</p><p>b</p>'
+    '</div><p>outside</p>'
+])
+def test_malformed_snippet_matches_soup(html):
+    assert extract_content(html) == _soup_content(html)
+
+
+@pytest.mark.parametrize('html, paragraphs', [
+    (
+        '<title>T</title><div id="mw-content-text"><p>a<p>b<div>x</div>'
+        '</div><p>outside</p>',
+        ['a', 'b']
+    ),
+    (
+        '<title>T</title><div id="mw-content-text"><p>a<ul><li>x</li></ul>'
+        '<p>b</div>',
+        ['a', 'b']
+    ),
+    (
+        '<title>T</title><div id="mw-content-text"><p>a<table><tr><td>'
+        '<div>x</div><p>c</p></td></tr></table><p>d',
+        ['a', 'c', 'd']
+    )
+])
+def test_implied_paragraph_ends(html, paragraphs):
+    # html.parser nests unclosed paragraphs where browsers close them,
+    # so these are checked against what a browser shows
+    assert extract_content(html) == ('T', paragraphs)
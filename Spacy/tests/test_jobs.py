@@ -0,0 +1,102 @@
+import time
+from threading import Event
+
+import spacy
+import pytest
+
+from jobs import Dispatcher, JobScheduler, JobState
+from utils import parse_string_content
+from exceptions import JobCancelled
+
+
+class DirectDispatcher:
+    """Runs callbacks straight away instead of on a Tk thread"""
+    def post(self, func, *args):
+        func(*args)
+
+
+class FakeRoot:
+    """Records after callbacks so the test can run them as Tk would"""
+    def __init__(self):
+        self.scheduled = []
+
+    def after(self, ms, func):
+        self.scheduled.append(func)
+        return len(self.scheduled)
+
+    def after_idle(self, func):
+        raise RuntimeError('main thread is not in main loop')
+
+    def run_pending(self):
+        scheduled, self.scheduled = self.scheduled, []
+        for func in scheduled:
+            func()
+
+
+def test_dispatcher_delivers_posts_without_calling_tk():
+    root = FakeRoot()
+    dispatcher = Dispatcher(root)
+    delivered = []
+    # Posted before the Tk thread starts draining, as during start up
+    dispatcher.post(delivered.append, 'early')
+    dispatcher.start()
+    root.run_pending()
+    dispatcher.post(delivered.append, 'later')
+    root.run_pending()
+    assert delivered == ['early', 'later']
+
+
+def test_timed_out_job_lets_next_job_start():
+    scheduler = JobScheduler(DirectDispatcher(), threads=1)
+    started = Event()
+
+    def slow(job):
+        while True:
+            job.check()
+            time.sleep(0.01)
+
+    slow_job = scheduler.submit(slow, name='slow', timeout=0.2)
+    scheduler.submit(lambda job: started.set(), name='next')
+    assert started.wait(timeout=5)
+    assert slow_job.state == JobState.TIMED_OUT
+
+
+def test_parse_checks_for_cancellation_between_chunks():
+    checks = []
+
+    def check():
+        checks.append(1)
+        if len(checks) > 1:
+            raise JobCancelled('parse')
+
+    text = 'One sentence here. ' * 50
+    with pytest.raises(JobCancelled):
+        parse_string_content(
+            spacy.blank('en'), text, max_chars=100, check=check
+        )
+    assert len(checks) == 2
+
+
+def test_shutdown_stops_threads_and_cancels_queued_jobs():
+    scheduler = JobScheduler(DirectDispatcher(), threads=1)
+    started, release = Event(), Event()
+
+    def block(job):
+        started.set()
+        release.wait(5)
+
+    running = scheduler.submit(block, name='running')
+    assert started.wait(timeout=5)
+    queued = [
+        scheduler.submit(lambda job: None, name=f'queued {i}')
+        for i in range(3)
+    ]
+    scheduler.shutdown()
+    late = scheduler.submit(lambda job: None, name='late')
+    release.set()
+    for thread in scheduler.threads:
+        thread.join(timeout=5)
+        assert not thread.is_alive()
+    assert running.state == JobState.DONE
+    assert late.state == JobState.CANCELLED
+    assert all(job.state == JobState.CANCELLED for job in queued)
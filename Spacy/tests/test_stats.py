@@ -0,0 +1,38 @@
+import spacy
+
+from stats import Statistics
+from history import History
+from utils import parse_string_content, paragraph_starts
+
+
+PARAGRAPHS = [
+    'The first paragraph is short.',
+    'A second one follows it here.',
+    'And the third closes the page.'
+]
+
+
+def _scraped_table():
+    # Scraped paragraphs are joined without line breaks
+    text = ''.join(PARAGRAPHS)
+    table = parse_string_content(spacy.blank('en'), text)
+    return table.with_paragraphs(paragraph_starts(PARAGRAPHS))
+
+
+def test_unstreamed_page_has_density_per_paragraph():
+    stats = Statistics()
+    stats.add(_scraped_table())
+    assert stats.paragraphs == len(PARAGRAPHS)
+    assert len(stats.density()) == len(PARAGRAPHS)
+
+
+def test_history_keeps_paragraph_offsets(tmp_path):
+    table = _scraped_table()
+    history = History(str(tmp_path / 'history.sqlite'))
+    run_id = history.record(
+        'page', 'Page', table.text, 'blank', table, 0.0, 0.0
+    )
+    _, _, loaded = history.load(run_id)
+    history.close()
+    assert loaded.paragraph_starts().tolist() \
+        == paragraph_starts(PARAGRAPHS)
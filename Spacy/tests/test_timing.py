@@ -0,0 +1,18 @@
+from timing import Timers, NULL_SPAN
+
+
+def test_timing_is_off_until_configured():
+    timers = Timers()
+    assert timers.span('stage') is NULL_SPAN
+    assert timers.recent() == []
+
+
+def test_held_spans_are_emitted_once_configured():
+    timers = Timers()
+    timers.hold()
+    with timers.span('startup.stage'):
+        pass
+    emitted = []
+    timers.subscribe(emitted.append)
+    timers.configure(True)
+    assert [record['stage'] for record in emitted] == ['startup.stage']
@@ -0,0 +1,38 @@
+import os
+import sys
+from pathlib import Path
+
+import workers
+from workers import WorkerPool
+
+
+def _init(name, components, cache_args):
+    # Spawned workers need the app directory to unpickle _parse
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+def _parse(text:str) -> str:
+    marker, _, word = text.partition('|')
+    if word == 'crash' and not os.path.exists(marker):
+        # Crash the first time only, the retry succeeds
+        Path(marker).touch()
+        os._exit(1)
+    return word.upper()
+
+
+def test_stream_restarts_once_after_worker_crash(tmp_path, monkeypatch):
+    monkeypatch.setattr(workers, '_init_worker', _init)
+    monkeypatch.setattr(workers, '_parse', _parse)
+    pool = WorkerPool('test', {}, workers=2)
+    starts = []
+    start = pool.start
+    monkeypatch.setattr(pool, 'start', lambda: starts.append(start()))
+    marker = tmp_path / 'crashed'
+    words = ['one', 'crash', 'two', 'three', 'four', 'five']
+    try:
+        results = list(pool.stream(
+            (f'{marker}|{word}' for word in words), window=4
+        ))
+    finally:
+        pool.shutdown()
+    assert results == [word.upper() for word in words]
+    assert len(starts) == 1
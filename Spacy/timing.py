@@ -0,0 +1,173 @@
+import json
+import time
+import logging
+from collections import deque
+from threading import Lock, local, current_thread
+from typing import Callable
+
+from constants import MAX_TIMINGS
+
+
+log = logging.getLogger(__name__)
+
+
+class _NullSpan:
+    """Span handed out while timing is off, it does nothing"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        return False
+
+    def set(self, **fields):
+        pass
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """Wall and CPU time of one stage, used as a context manager"""
+    __slots__ = (
+        'timers', 'stage', 'fields', 'parent', '_started', '_wall', '_cpu'
+    )
+
+    def __init__(self, timers:'Timers', stage:str, fields:dict):
+        self.timers = timers
+        self.stage = stage
+        self.fields = fields
+        self.parent = None
+
+    def __enter__(self):
+        stack = self.timers._stack()
+        self.parent = stack[-1].stage if stack else None
+        stack.append(self)
+        self._started = time.time()
+        self._cpu = time.thread_time()
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> bool:
+        wall = time.perf_counter() - self._wall
+        cpu = time.thread_time() - self._cpu
+        self.timers._stack().pop()
+        if exc_type is not None:
+            self.fields['error'] = exc_type.__name__
+        self.timers._record({
+            'stage': self.stage, 'started': self._started,
+            'wall_s': round(wall, 6), 'cpu_s': round(cpu, 6),
+            'thread': current_thread().name, 'parent': self.parent,
+            **self.fields
+        })
+        return False
+
+    def set(self, **fields):
+        """Add fields to the record, such as the number of tokens"""
+        self.fields.update(fields)
+
+
+class Timers:
+    """
+        Process level recorder of stage timings. Stages are timed with
+        span, which returns a shared no-op span while timing is off so
+        the cost of an instrumented stage is one attribute check.
+        Finished spans go to the log, to a JSON Lines file and to any
+        listeners.
+
+        Timing is off until it is configured. The app calls hold as
+        it starts, so that spans closed before configure is called are
+        kept until then and emitted if timing is on.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.configured = False
+        self.listeners = []
+        self._path = None
+        self._file = None
+        self._lock = Lock()
+        self._local = local()
+        self._records = deque(maxlen=MAX_TIMINGS)
+
+    def span(self, stage:str, **fields) -> Span | _NullSpan:
+        """Returns a context manager that times a stage"""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, stage, fields)
+
+    def hold(self):
+        """Record spans and hold them until configure is called"""
+        with self._lock:
+            if not self.configured:
+                self.enabled = True
+
+    def configure(self, enabled:bool, path:str=None):
+        """Turn timing on or off, records are appended to path"""
+        with self._lock:
+            self.enabled = enabled
+            held = [] if self.configured else list(self._records)
+            self.configured = True
+            if self._file is not None and path != self._path:
+                self._file.close()
+                self._file = None
+            self._path = path
+            if not enabled:
+                self._records.clear()
+        log.info(f'Stage timing {"enabled" if enabled else "disabled"}')
+        if enabled:
+            for record in held:
+                self._emit(record)
+
+    def recent(self) -> list[dict]:
+        """Returns the latest records, oldest first"""
+        with self._lock:
+            return list(self._records)
+
+    def subscribe(self, listener:Callable[[dict], None]):
+        """Call listener with every record, from the recording thread"""
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener:Callable[[dict], None]):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def _stack(self) -> list[Span]:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _record(self, record:dict):
+        with self._lock:
+            self._records.append(record)
+            if not self.configured:
+                return
+        self._emit(record)
+
+    def _emit(self, record:dict):
+        extra = ', '.join(
+            f'{key}={value}' for key, value in record.items()
+            if key not in ('stage', 'started', 'wall_s', 'cpu_s', 'thread')
+            and value is not None
+        )
+        log.info(
+            f'{record["stage"]} took {record["wall_s"] * 1000:.1f}ms wall, '
+            f'{record["cpu_s"] * 1000:.1f}ms cpu' \
+            + (f' ({extra})' if extra else '')
+        )
+        if self._path is not None:
+            with self._lock:
+                try:
+                    if self._file is None:
+                        self._file = open(
+                            self._path, 'a', encoding='utf-8'
+                        )
+                    self._file.write(json.dumps(record) + '\n')
+                    self._file.flush()
+                except OSError as e:
+                    log.warning(f'Could not write timings: {e}')
+        for listener in list(self.listeners):
+            listener(record)
+
+
+timers = Timers()
@@ -1,18 +1,28 @@
+from __future__ import annotations
 import logging
-import requests
-import numpy as np
-from spacy.language import Language
-from bs4 import BeautifulSoup
 from pathlib import Path
 from datetime import datetime
-from typing import TextIO
+from typing import Callable, TextIO, Iterable, Iterator, TYPE_CHECKING
 from itertools import count
-from PIL import Image, ImageTk
 
 from constants import (
-    ASSETS_PATH, PATH, FILENAME_PREFIX_FORMAT, ODD, EVEN
+    PATH, FILENAME_PREFIX_FORMAT, ODD, EVEN, PIPELINES, HTTP_TIMEOUT_S
 )
-from exceptions import ImageNotFound
+from assets import icons
+from timing import timers
+from cache import HTTPCache, ParseCache
+from history import History
+from results import TokenTable
+from chunking import chunk_text
+from extract import extract_content
+
+# spaCy is imported where it is used so the GUI can be shown before
+# it has finished loading. numpy is imported at start up with the
+# token tables, it takes a fraction of that time.
+if TYPE_CHECKING:
+    from tkinter import PhotoImage
+    from spacy.language import Language
+    from spacy.tokens import Doc
 
 
 log = logging.getLogger(__name__)
@@ -24,36 +34,45 @@ def validate_dirs(dirs) -> None:
     # create directories in the appdata dir
     Path(dirs.user_config_dir).mkdir(parents=True, exist_ok=True)
     Path(dirs.user_log_dir).mkdir(parents=True, exist_ok=True)
+    Path(dirs.user_cache_dir).mkdir(parents=True, exist_ok=True)
+    Path(dirs.user_data_dir).mkdir(parents=True, exist_ok=True)
     # create directories with the project files
     for folder_name in ('output', 'assets', 'theme'):
         Path(
             f'{PATH}\{folder_name}'
         ).mkdir(parents=True, exist_ok=True)
 
-def open_new_file(dir:str, prefix:str='', ext:str='txt') -> TextIO:
-    """Create a new file with a unique filename"""
+def _new_filenames(prefix:str, ext:str) -> Iterator[str]:
     timestamp = datetime.now().strftime(FILENAME_PREFIX_FORMAT)
-    filenames = (
-            f'{prefix}_{timestamp}.txt' if i == 0 else \
+    return (
+            f'{prefix}_{timestamp}.{ext}' if i == 0 else \
             f'{prefix}_{timestamp}_{i}.{ext}' for i in count()
         )
-    for filename in filenames:
+
+def unique_path(dir:str, prefix:str='', ext:str='txt') -> str:
+    """Returns the path of a file with a unique filename"""
+    for filename in _new_filenames(prefix, ext):
+        path = f'{dir}/{filename}'
+        if not Path(path).exists():
+            return path
+
+def open_new_file(
+        dir:str, prefix:str='', ext:str='txt', newline:str=None
+    ) -> TextIO:
+    """Create a new file with a unique filename"""
+    for filename in _new_filenames(prefix, ext):
         try:
             path = f'{dir}/{filename}'
             log.debug(f'Creating file at {path}')
-            return (Path(path).open('x', encoding='utf-8'))
+            return (
+                Path(path).open('x', encoding='utf-8', newline=newline)
+            )
         except FileExistsError:
             continue
 
-def image(filename:str, size:tuple[int, int]) -> ImageTk.PhotoImage:
+def image(filename:str, size:tuple[int, int]) -> PhotoImage:
     """returns PhotoImage object obtained from file path"""
-    fp = f'{ASSETS_PATH}\{filename}'
-    if not Path(fp).exists():
-        log.error(f'could not find image at fp: {fp}')
-        raise ImageNotFound
-    im = Image.open(fp)
-    im = im.resize(size, Image.ANTIALIAS)
-    return ImageTk.PhotoImage(im)
+    return icons.get(filename, size)
 
 def up_list(_list:list[str]) -> list[str]:
     """
@@ -67,42 +86,175 @@ def up_list(_list:list[str]) -> list[str]:
         # Is this pythonic?
         raise TypeError('Items in list must be of type str')
 
+def fetch_html(url:str, cache:HTTPCache=None) -> bytes:
+    """Returns the body of the page at url, through the cache if given"""
+    if cache is not None:
+        return cache.get(url)
+    import requests
+    return requests.get(url, timeout=HTTP_TIMEOUT_S).content
+
 def web_scrape(
-        url:str, search_for:str='p', remove_linebreak:bool=False
+        url:str, search_for:str='p', remove_linebreak:bool=False,
+        cache:HTTPCache=None
     ) -> dict:
     """Returns scraped web content"""
-    result = requests.get(url)
-    soup = BeautifulSoup(result.content, 'html.parser')
-    content = [item.get_text() for item in soup.find_all(search_for)]
+    with timers.span('fetch.download', url=url):
+        html = fetch_html(url, cache)
+    with timers.span('fetch.extract', url=url) as span:
+        title, content = extract_content(html, search_for)
+        span.set(bytes=len(html), paragraphs=len(content))
     if remove_linebreak:
         content = [item.replace('\n', '') for item in content]
-    title = soup.title.string
     return title, content
 
-def parse_string_content(pipeline:Language, string:str) -> list[list]:
-    """Returns parsed string content as [word, entity, pos]"""
-    document = pipeline(string)
-    parsed = np.array(
-        [[token.text, token.ent_type_, token.pos_] \
-        for token in document]
-    )
-    # Replace empty strings with 'N/A' in the entitiy
-    # column.
+def read_text_file(fp:str) -> tuple[str, str]:
+    """Returns a title derived from the filename and the file content"""
     try:
-        parsed[np.where(parsed=='')] = 'N/A'
-    except ValueError:
-        pass
-    return parsed.tolist()
+        with open(fp, 'r') as file:
+            title = fp.replace('\\', '/').split('/')[-1]
+            content = file.read()
+    except FileNotFoundError:
+        return 'Content Not Found', ''
+    title = title.split('.')[0].replace('_', ' ').title()
+    return title, content
+
+def pipeline_name(preference:str) -> str:
+    """Returns the spacy package name for a pipeline preference"""
+    return PIPELINES.get(preference, PIPELINES['speed'])
+
+def parse_string_content(
+        pipeline:Language, string:str, cache:ParseCache=None,
+        max_chars:int=None, batch_size:int=1, check:Callable=lambda: None
+    ) -> TokenTable:
+    """
+        Returns parsed string content as a token table. Text longer
+        than max_chars is parsed in chunks, batch_size chunks at a
+        time, and the chunk tables are merged. check is called between
+        chunks and may raise to abandon the parse.
+    """
+    max_chars = min(max_chars or pipeline.max_length, pipeline.max_length)
+    variant = 'whole' if len(string) <= max_chars else f'chunks-{max_chars}'
+    with timers.span('parse.string', chars=len(string)) as span:
+        if cache is not None:
+            documents = cache.get(pipeline, string, variant=variant)
+            if documents is not None:
+                table = TokenTable.concat(map(parse_document, documents))
+                span.set(tokens=len(table), cached=True)
+                return table
+            entry = cache.docbin()
+        tables = []
+        chunks = chunk_text(string, max_chars)
+        for document in pipeline.pipe(chunks, batch_size=batch_size):
+            check()
+            if cache is not None:
+                entry.add(document)
+            tables.append(parse_document(document))
+        if cache is not None:
+            cache.put(pipeline, string, entry, variant=variant)
+        table = TokenTable.concat(tables)
+        span.set(tokens=len(table))
+    return table
+
+def stream_parse(
+        pipeline:Language, paragraphs:list[str], batch_size:int=1,
+        cache:ParseCache=None, max_chars:int=None
+    ) -> Iterator[TokenTable]:
+    """
+        Yields a token table for each paragraph as soon as that
+        paragraph has been parsed. Paragraphs longer than max_chars
+        are yielded in chunks.
+    """
+    max_chars = min(max_chars or pipeline.max_length, pipeline.max_length)
+    texts = [
+        chunk for paragraph in paragraphs if paragraph
+        for chunk in chunk_text(paragraph, max_chars)
+    ]
+    if cache is not None:
+        string = "".join(texts)
+        documents = cache.get(pipeline, string, variant='stream')
+        if documents is not None:
+            for document in documents:
+                yield parse_document(document)
+            return
+        entry = cache.docbin()
+    for document in pipeline.pipe(texts, batch_size=batch_size):
+        if cache is not None:
+            entry.add(document)
+        yield parse_document(document)
+    if cache is not None:
+        cache.put(pipeline, string, entry, variant='stream')
+
+def chunked(items:Iterable[tuple], max_chars:int) -> Iterator[tuple]:
+    """
+        Splits the text of each (text, context) item into chunks that
+        fit the pipeline. Each chunk's context gets a flag that is set
+        on the last chunk of a text, so the chunks can be merged back
+        into one document.
+    """
+    for text, context in items:
+        chunks = list(chunk_text(text, max_chars))
+        for i, chunk in enumerate(chunks):
+            yield chunk, (*context, i == len(chunks) - 1)
+
+def split_paragraphs(content:str|list[str]) -> list[str]:
+    """Returns content as a list of paragraphs"""
+    if isinstance(content, str):
+        return content.splitlines(keepends=True)
+    return content
+
+def paragraph_starts(paragraphs:list[str]) -> list[int]:
+    """Returns the offset of each paragraph in the joined paragraphs"""
+    starts = []
+    offset = 0
+    for paragraph in paragraphs:
+        if paragraph:
+            starts.append(offset)
+        offset += len(paragraph)
+    return starts
+
+def timings_path(dirs) -> str:
+    """Returns the JSON Lines file stage timings are appended to"""
+    return f'{dirs.user_log_dir}/timings.jsonl'
+
+def history_store(dirs) -> History:
+    """Returns the history database in the user data directory"""
+    return History(f'{dirs.user_data_dir}/history.sqlite3')
+
+def http_cache(dirs, settings) -> HTTPCache:
+    """Returns the http cache configured by the settings section"""
+    return HTTPCache(
+        f'{dirs.user_cache_dir}/http',
+        ttl=float(settings['cache_ttl_hours']) * 3600,
+        max_bytes=int(settings['cache_size_mb']) * 1024 ** 2
+    )
+
+def parse_cache_args(dirs, settings) -> tuple[str, int]:
+    """Returns the directory and size limit of the parse cache"""
+    return (
+        f'{dirs.user_cache_dir}/parsed',
+        int(settings['parse_cache_size_mb']) * 1024 ** 2
+    )
+
+def parse_cache(dirs, settings) -> ParseCache:
+    """Returns the parse result cache configured by the settings"""
+    directory, max_bytes = parse_cache_args(dirs, settings)
+    return ParseCache(directory, max_bytes=max_bytes)
+
+def parse_document(document:Doc) -> TokenTable:
+    """Returns an already processed document as a token table"""
+    return TokenTable.from_doc(document)
 
 def parity(integer:int) -> str:
     """Returns 'even' or 'odd' when given an integer"""
     return EVEN if integer % 2 == 0 else ODD
 
 def get_children(widget) -> list:
-    children = widget.winfo_children()
-    for child in children:
-        inner_children = child.winfo_children()
-        if inner_children:
-            children.extend(inner_children)
+    """Returns every widget below widget, each parent before its children"""
+    children = []
+    stack = [widget]
+    while stack:
+        for child in stack.pop().winfo_children():
+            children.append(child)
+            stack.append(child)
     return children
 
@@ -0,0 +1,197 @@
+from __future__ import annotations
+import atexit
+import logging
+from collections import deque
+from threading import Lock
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Iterable, Iterator
+
+from results import TokenTable
+from chunking import chunk_text
+
+
+log = logging.getLogger(__name__)
+
+# Pipeline and parse cache held by each worker process
+_pipeline = None
+_cache = None
+
+
+def _init_worker(name:str, components:dict, cache_args:tuple | None):
+    """Runs once in every worker process to load its pipeline"""
+    global _pipeline, _cache
+    from pipeline import load_pipeline
+    from cache import ParseCache
+    from timing import timers
+    # Stages are timed in the app process
+    timers.configure(False)
+    _pipeline = load_pipeline(name, **components)
+    if cache_args is not None:
+        directory, max_bytes = cache_args
+        _cache = ParseCache(directory, max_bytes=max_bytes)
+
+def _parse(text:str) -> TokenTable:
+    from utils import parse_string_content
+    return parse_string_content(_pipeline, text, cache=_cache)
+
+
+class WorkerPool:
+    """
+        Pool of processes that each hold a loaded pipeline. Text is
+        sent to the workers as jobs and compact token tables come back,
+        so parsing never holds the GIL of the GUI process. Workers that
+        crash are replaced and their job is retried once.
+    """
+    def __init__(
+            self, name:str, components:dict, workers:int,
+            cache_args:tuple=None
+        ):
+        self.name = name
+        self.components = components
+        self.workers = workers
+        self.cache_args = cache_args
+        self._lock = Lock()
+        self._executor = None
+        self._warmup = []
+        self.start()
+
+    def start(self):
+        """Start the worker processes, they load their pipelines async"""
+        log.info(f'Starting {self.workers} nlp workers for {self.name}')
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.name, self.components, self.cache_args)
+        )
+        # Submitting a no-op makes the workers load their pipelines now
+        # rather than when the first real job arrives.
+        self._warmup = [
+            self._executor.submit(int) for _ in range(self.workers)
+        ]
+
+    def wait_ready(self):
+        """Block until every worker has loaded its pipeline"""
+        for future in self._warmup:
+            future.result()
+
+    def _restart(self, broken:ProcessPoolExecutor):
+        with self._lock:
+            if self._executor is not broken:
+                return  # another caller already restarted the pool
+            log.error('An nlp worker crashed, restarting the worker pool')
+            broken.shutdown(wait=False, cancel_futures=True)
+            self.start()
+
+    def submit(self, text:str) -> Future:
+        """Submit text to be parsed, restarting a broken pool first"""
+        return self._submit(text)[0]
+
+    def _submit(self, text:str) -> tuple[Future, ProcessPoolExecutor]:
+        """Returns the future of a parse and the executor running it"""
+        executor = self._executor
+        try:
+            return executor.submit(_parse, text), executor
+        except BrokenProcessPool:
+            self._restart(executor)
+            executor = self._executor
+            return executor.submit(_parse, text), executor
+
+    def _result(
+            self, future:Future, executor:ProcessPoolExecutor, text:str
+        ) -> TokenTable:
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            # Only the executor that ran the future is restarted, the
+            # other futures it broke find it already replaced.
+            self._restart(executor)
+            future, _ = self._submit(text)
+            return future.result()
+
+    def parse(
+            self, text:str, max_chars:int=None, check:Callable=lambda: None
+        ) -> TokenTable:
+        """
+            Parse text and return its token table. Text longer than
+            max_chars is split into chunks that are parsed in parallel,
+            check is called as each one arrives and may raise to
+            abandon the parse.
+        """
+        if max_chars is None or len(text) <= max_chars:
+            return self._result(*self._submit(text), text)
+        tables = []
+        results = self.stream(chunk_text(text, max_chars))
+        try:
+            for table in results:
+                check()
+                tables.append(table)
+        finally:
+            results.close()
+        return TokenTable.concat(tables)
+
+    def stream(
+            self, paragraphs:Iterable[str], window:int=None
+        ) -> Iterator[TokenTable]:
+        """
+            Parse paragraphs in parallel and yield their tables in
+            order as soon as each one is ready. At most window
+            paragraphs are in flight at once, which bounds the memory
+            held by finished but unread results.
+        """
+        window = window or self.workers * 2
+        texts = (paragraph for paragraph in paragraphs if paragraph)
+        pending = deque()
+        try:
+            for text in texts:
+                pending.append((*self._submit(text), text))
+                if len(pending) >= window:
+                    yield self._result(*pending.popleft())
+            while pending:
+                yield self._result(*pending.popleft())
+        finally:
+            # Drop queued paragraphs if the consumer stops early
+            for future, _, _ in pending:
+                future.cancel()
+
+    def shutdown(self):
+        log.info('Shutting down nlp workers')
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pools = {}
+
+def worker_pool(
+        name:str, components:dict, workers:int, cache_args:tuple=None,
+        keep_old:bool=False
+    ) -> WorkerPool:
+    """
+        Returns the process level worker pool for these settings. Pools
+        outlive app restarts, a pool with other settings is shut down
+        unless keep_old is set, in which case the caller retires it
+        with retire_pool once it is no longer in use.
+    """
+    key = (name, repr(components), workers, cache_args)
+    pool = _pools.get(key)
+    if pool is not None:
+        return pool
+    if not keep_old:
+        for old in _pools.values():
+            old.shutdown()
+        _pools.clear()
+    pool = WorkerPool(name, components, workers, cache_args)
+    _pools[key] = pool
+    return pool
+
+def retire_pool(pool:WorkerPool):
+    """Shut down a pool that has been replaced"""
+    for key, other in list(_pools.items()):
+        if other is pool:
+            del _pools[key]
+    pool.shutdown()
+
+@atexit.register
+def _shutdown_pools():
+    for pool in _pools.values():
+        pool.shutdown()